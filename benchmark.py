@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from fileutil import atomic_write
+
+# ベンチマーク名: (説明, 準備関数)
+# 準備関数は合成データを作り、計測対象の引数なし関数を返す（準備時間は計測しない）
+BENCHMARKS = {}
+
+
+def benchmark(name, description):
+    def register(setup):
+        BENCHMARKS[name] = (description, setup)
+        return setup
+    return register
+
+
+def synth_audio(seconds, sr=16000, seed=0):
+    """発話（倍音を持つ正弦波の振幅変調）・無音・背景雑音を交互に並べた合成音声を作る。"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    audio = np.zeros(n, dtype=np.float32)
+    pos = 0
+    while pos < n:
+        speech = int(rng.uniform(0.5, 3.0) * sr)
+        t = np.arange(min(speech, n - pos)) / sr
+        f0 = rng.uniform(100, 250)
+        voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+        envelope = 0.5 * (1 + np.sin(2 * np.pi * rng.uniform(2, 6) * t))
+        audio[pos:pos + len(t)] = 0.3 * voice * envelope
+        pos += len(t) + int(rng.uniform(0.3, 2.0) * sr)
+    audio += rng.normal(0, 0.01, n).astype(np.float32)
+    return audio
+
+
+def synth_transcript(chars, seed=0):
+    """Whisper の出力に近い、空白区切り・句点あり・話者ごとに改行された日本語テキストを作る。"""
+    rng = np.random.default_rng(seed)
+    words = ["今日は", "会議の", "議題について", "確認します", "はい", "承知しました", "次に",
+             "スケジュールを", "共有します", "よろしくお願いします", "質問が", "あります"]
+    lines = []
+    total = 0
+    while total < chars:
+        speaker = "AB"[len(lines) % 2]
+        picks = rng.choice(words, size=int(rng.integers(5, 40)))
+        line = f"話者{speaker}: " + " ".join(f"{word}。" if i % 7 == 6 else word for i, word in enumerate(picks))
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+
+def synth_mermaid(tables, columns_per_table):
+    lines = ["erDiagram"]
+    for t in range(tables):
+        lines.append(f'    "テーブル{t}(table_{t})" {{')
+        lines.append("        bigint id PK")
+        for c in range(columns_per_table):
+            keys = " FK" if c == 0 and t else ""
+            lines.append(f'        varchar(255) column_{c}{keys} "カラム{c}*"')
+        lines.append("    }")
+        if t:
+            lines.append(f'    "テーブル{t - 1}(table_{t - 1})" ||--o{{ "テーブル{t}(table_{t})" : "has"')
+    return "\n".join(lines) + "\n"
+
+
+def synth_markdown(tables, rows_per_table):
+    lines = []
+    for t in range(tables):
+        lines += [f"## マスター{t}(master_{t})", "", "| ID | キー名 | 名前 | 備考 |", "| --- | --- | --- | --- |"]
+        lines += [f"| {r} | key_{r} | 名前{r} | 備考{r} |" for r in range(rows_per_table)]
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _write(directory, name, text):
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+
+@benchmark("convert.load_audio", "PCM16 WAV の読み込み（同じサンプルレートならメモリマップ）")
+def _bench_load_audio(options, workdir):
+    import convert
+
+    path = os.path.join(workdir, "audio.wav")
+    if not os.path.exists(path):
+        convert.save_audio(path, synth_audio(options.audio_seconds), 16000)
+    return lambda: convert.load_audio(path, sr=16000)
+
+
+@benchmark("convert.load_audio[mp3]", "MP3 の読み込み（ffmpeg パイプでのデコードとリサンプリング）")
+def _bench_load_audio_mp3(options, workdir):
+    import convert
+
+    path = os.path.join(workdir, "audio.mp3")
+    if not os.path.exists(path):
+        convert.save_audio(path, synth_audio(options.audio_seconds), 16000, format="mp3")
+    return lambda: convert.load_audio(path, sr=16000)
+
+
+@benchmark("convert.noise_reduction", "noisereduce によるノイズ除去")
+def _bench_noise_reduction(options, workdir):
+    import convert
+
+    audio = synth_audio(options.audio_seconds)
+    return lambda: convert.noise_reduction(audio, 16000)
+
+
+@benchmark("convert.noise_reduction[profile]", "キャッシュした雑音プロファイルを使う定常モードのノイズ除去")
+def _bench_noise_reduction_profile(options, workdir):
+    import convert
+
+    audio = synth_audio(options.audio_seconds)
+    profile = convert.estimate_noise_profile(audio, 16000)
+    return lambda: convert.noise_reduction(audio, 16000, profile)
+
+
+@benchmark("convert.bandpass_filter", "300–3400 Hz のバンドパスフィルタ")
+def _bench_bandpass_filter(options, workdir):
+    import convert
+
+    audio = synth_audio(options.audio_seconds)
+    return lambda: convert.bandpass_filter(audio, 16000)
+
+
+@benchmark("convert.vad_filter", "webrtcvad による無音区間の除去")
+def _bench_vad_filter(options, workdir):
+    import convert
+
+    audio = synth_audio(options.audio_seconds)
+    return lambda: convert.vad_filter(audio, 16000)
+
+
+@benchmark("format_transcription.split_text_by_tokens", "トークン数による文字起こしの分割")
+def _bench_split_text_by_tokens(options, workdir):
+    import format_transcription
+
+    text = synth_transcript(options.transcript_chars)
+    # エンコーダの読み込み（BPE ファイルの取得を含む）は計測から除く
+    format_transcription.token_byte_offsets("準備", model="gpt-4o-mini")
+    return lambda: format_transcription.split_text_by_tokens(text, 8000, model="gpt-4o-mini")
+
+
+@benchmark("process_transcript.split_text_by_conversation", "会話の区切りを保った文字数による分割")
+def _bench_split_text_by_conversation(options, workdir):
+    import process_transcript
+
+    text = synth_transcript(options.transcript_chars)
+    return lambda: process_transcript.split_text_by_conversation(text)
+
+
+@benchmark("generate_columns_from_mermaid.mermaid_to_columns", "Mermaid ER 図のパース（キャッシュなし）")
+def _bench_mermaid_to_columns(options, workdir):
+    from generate_columns_from_mermaid import mermaid_to_columns
+
+    path = _write(workdir, "schema.mmd", synth_mermaid(options.tables, options.columns))
+    return lambda: mermaid_to_columns(path, cache_dir=None)
+
+
+@benchmark("generate_columns_from_mermaid.mermaid_to_columns[cached]", "Mermaid ER 図のパース（キャッシュあり）")
+def _bench_mermaid_to_columns_cached(options, workdir):
+    from generate_columns_from_mermaid import mermaid_to_columns
+
+    path = _write(workdir, "schema.mmd", synth_mermaid(options.tables, options.columns))
+    cache_dir = os.path.join(workdir, "mermaid_cache")
+    mermaid_to_columns(path, cache_dir=cache_dir)
+    return lambda: mermaid_to_columns(path, cache_dir=cache_dir)
+
+
+@benchmark("markdown_to_csv.markdown_to_rows", "マスターデータ Markdown のパース")
+def _bench_markdown_to_rows(options, workdir):
+    from markdown_to_csv import markdown_to_rows
+
+    path = _write(workdir, "master.md", synth_markdown(options.tables, options.columns))
+    return lambda: markdown_to_rows(path)
+
+
+def measure(function, repeat, warmup=1):
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "mean": statistics.fmean(times), "repeat": repeat}
+
+
+def run(names, options):
+    """
+    指定したベンチマークを実行し、結果の辞書を返す。準備（BPE ファイルの取得など）に失敗したものは
+    skipped に、計測対象の関数が例外を送出したものは failed に理由を残す。
+    """
+    results = {}
+    skipped = {}
+    failed = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            _, setup = BENCHMARKS[name]
+            try:
+                function = setup(options, workdir)
+            except Exception as e:
+                skipped[name] = f"{type(e).__name__}: {e}"
+                continue
+            try:
+                results[name] = measure(function, options.repeat, options.warmup)
+            except Exception as e:
+                failed[name] = f"{type(e).__name__}: {e}"
+                print(f"{name:<58} FAILED ({failed[name]})", file=sys.stderr)
+                continue
+            print(f"{name:<58} median {results[name]['median'] * 1000:10.2f} ms"
+                  f"  min {results[name]['min'] * 1000:10.2f} ms", file=sys.stderr)
+    for name, reason in skipped.items():
+        print(f"{name:<58} skipped ({reason})", file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "parameters": {
+                "audio_seconds": options.audio_seconds,
+                "transcript_chars": options.transcript_chars,
+                "tables": options.tables,
+                "columns": options.columns,
+            },
+        },
+        "results": results,
+        "skipped": skipped,
+        "failed": failed,
+    }
+
+
+def compare(current, baseline, threshold):
+    """
+    中央値を基準の結果と比べ、(名前, 基準, 今回, 比率, 劣化したか) のリストを返す。
+    比率が 1 + threshold を超えたものを劣化とみなす。今回実行したもののうち、基準にはあるのに
+    結果がない（失敗した・準備できなかった）ものも、今回と比率を None として劣化に数える。
+    """
+    if current["meta"]["parameters"] != baseline["meta"].get("parameters"):
+        print("警告: 基準の結果とデータサイズが異なります", file=sys.stderr)
+    attempted = [*current["results"], *current.get("skipped", {}), *current.get("failed", {})]
+    rows = []
+    for name in attempted:
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        result = current["results"].get(name)
+        if result is None:
+            rows.append((name, base["median"], None, None, True))
+            continue
+        ratio = result["median"] / base["median"] if base["median"] else float("inf")
+        rows.append((name, base["median"], result["median"], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the audio and text hot paths on synthetic data')
+    parser.add_argument('names', nargs='*', help='benchmarks to run (default: all; a prefix such as "convert." selects a group)')
+    parser.add_argument('--list', action='store_true', help='list benchmarks and exit')
+    parser.add_argument('--output', '-o', type=str, help='write results to this JSON file')
+    parser.add_argument('--baseline', '-b', type=str, help='compare with a previous results JSON file')
+    parser.add_argument('--threshold', '-t', type=float, default=0.1, help='allowed slowdown ratio against the baseline (0.1 = 10%%)')
+    parser.add_argument('--repeat', '-r', type=int, default=5, help='timed runs per benchmark')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed runs per benchmark')
+    parser.add_argument('--audio_seconds', type=float, default=60, help='length of the synthetic audio')
+    parser.add_argument('--transcript_chars', type=int, default=1_000_000, help='length of the synthetic transcript')
+    parser.add_argument('--tables', type=int, default=500, help='tables in the synthetic mermaid / markdown schemas')
+    parser.add_argument('--columns', type=int, default=30, help='columns (rows for markdown) per synthetic table')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        width = max(map(len, BENCHMARKS))
+        for name, (description, _) in BENCHMARKS.items():
+            print(f"{name:<{width}}  {description}")
+        return 0
+
+    names = [name for name in BENCHMARKS if not args.names or any(name.startswith(prefix) for prefix in args.names)]
+    if not names:
+        parser.error(f"no benchmark matches {' '.join(args.names)}")
+    current = run(names, args)
+
+    if args.output:
+        with atomic_write(args.output) as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(current, baseline, args.threshold)
+        for name, base, now, ratio, regressed in rows:
+            if now is None:
+                reason = current["failed"].get(name) or current["skipped"].get(name)
+                print(f"{name:<58} {base * 1000:10.2f} ms -> no result ({reason})  REGRESSION")
+                continue
+            mark = "REGRESSION" if regressed else "ok"
+            print(f"{name:<58} {base * 1000:10.2f} ms -> {now * 1000:10.2f} ms  x{ratio:5.2f}  {mark}")
+        if any(row[4] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
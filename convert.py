@@ -1,50 +1,314 @@
-import librosa
-import numpy as np
-import scipy.signal as signal
-import noisereduce as nr
-import webrtcvad
-import wave
+import argparse
+import glob
+import itertools
+import os
+import re
+import shutil
 import struct
-from pydub import AudioSegment
+import subprocess
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import fileutil
+import metrics
+
+# librosa / noisereduce / scipy / webrtcvad / pydub は読み込みが重いため、使う関数の中で import する
+
+DEFAULT_NOISE_PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tools", "noise_profiles")
+# --noise_profile file ではファイルごとにプロファイルができるので、最近使ったものからこの数だけ残す
+NOISE_PROFILE_MAX_ENTRIES = 256
+
+def _ffmpeg_decode_command(file_path, sr):
+    """ モノラル s16le PCM を標準出力に書き出す ffmpeg コマンド """
+    return [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-i", file_path,
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sr), "pipe:1",
+    ]
+
+def _pcm16_to_float(pcm):
+    """ int16 PCM を 1 回のコピーで float32 に変換 """
+    return np.multiply(pcm, 1 / 32768, dtype=np.float32)
+
+def _wav_layout(file_path):
+    """ WAV ヘッダを読み、(フォーマット, チャンネル数, サンプリングレート, ビット数, data 開始位置, data サイズ) を返す """
+    with open(file_path, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+            if chunk_id == b"fmt ":
+                body = f.read(size + (size & 1))
+                format_tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if format_tag == 0xFFFE and len(body) >= 26:
+                    format_tag = struct.unpack("<H", body[24:26])[0]  # WAVE_FORMAT_EXTENSIBLE のサブフォーマット
+                fmt = (format_tag, channels, rate, bits)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    return None
+                return (*fmt, f.tell(), size)
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+
+# MPEG-1 / MPEG-2(.5) Layer III のビットレート（kbps）
+MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+def _mp3_layout(file_path):
+    """
+    最初の MP3 フレームヘッダを読み、(サンプリングレート, チャンネル数, 秒数) を返す。
+    秒数は Xing / Info ヘッダ（VBR）のフレーム数から、なければ CBR とみなしてファイルサイズから求める。
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        header = f.read(10)
+        offset = 0
+        if header[:3] == b"ID3":
+            # ID3v2 タグを読み飛ばす（サイズは synchsafe integer）
+            offset = 10 + sum((b & 0x7F) << (7 * (3 - i)) for i, b in enumerate(header[6:10]))
+            if header[5] & 0x10:
+                offset += 10
+        f.seek(offset)
+        data = f.read(4096)
+    for i in range(len(data) - 3):
+        if data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+            continue
+        h = int.from_bytes(data[i:i + 4], "big")
+        version_bits, layer_bits = (h >> 19) & 3, (h >> 17) & 3
+        bitrate_index, rate_index, mode = (h >> 12) & 0xF, (h >> 10) & 3, (h >> 6) & 3
+        if version_bits == 1 or layer_bits != 1 or rate_index == 3 or bitrate_index in (0, 15):
+            continue  # Layer III ではないか、不正なヘッダ
+        version = 1 if version_bits == 3 else 2
+        rate = (44100, 48000, 32000)[rate_index] // {3: 1, 2: 2, 0: 4}[version_bits]
+        channels = 1 if mode == 3 else 2
+        samples_per_frame = 1152 if version == 1 else 576
+        side_info = (32 if channels == 2 else 17) if version == 1 else (17 if channels == 2 else 9)
+        xing = data[i + 4 + side_info:i + 4 + side_info + 12]
+        if xing[:4] in (b"Xing", b"Info") and struct.unpack(">I", xing[4:8])[0] & 1:
+            duration = struct.unpack(">I", xing[8:12])[0] * samples_per_frame / rate
+        else:
+            duration = (file_size - offset - i) * 8 / (MP3_BITRATES[version][bitrate_index] * 1000)
+        return rate, channels, duration
+    return None
+
+# ヘッダから長さが分からないファイルの長さを、この平均ビットレート（バイト/秒）で見積もる
+FALLBACK_BYTES_PER_SECOND = 128000 // 8
+
+def audio_duration(file_path):
+    """ WAV / MP3 のヘッダから再生時間（秒）を求める（読めなければ None） """
+    lower = file_path.lower()
+    try:
+        if lower.endswith(".wav"):
+            layout = _wav_layout(file_path)
+            if layout is not None:
+                _, channels, rate, bits, offset, size = layout
+                frame_bytes = channels * max(bits, 8) // 8
+                if frame_bytes and rate:
+                    return min(size, os.path.getsize(file_path) - offset) / (frame_bytes * rate)
+        elif lower.endswith(".mp3"):
+            layout = _mp3_layout(file_path)
+            if layout is not None:
+                return layout[2]
+    except (OSError, struct.error):
+        pass
+    return None
+
+def estimated_duration(file_path):
+    """ 処理順を決めるための長さ。ヘッダから読めなければファイルサイズから見積もる """
+    duration = audio_duration(file_path)
+    if duration is None:
+        duration = os.path.getsize(file_path) / FALLBACK_BYTES_PER_SECOND
+    return duration
+
+def load_audio(file_path, sr=16000, backend="auto"):
+    """
+    MP3 または WAV を読み込んで numpy 配列に変換。
+    backend="auto" では、目的のサンプリングレートの 16bit PCM WAV はデコードせずメモリマップし、
+    それ以外は ffmpeg のパイプから直接読み込む（ffmpeg がなければ pydub / librosa を使う）。
+    """
+    if backend == "auto":
+        layout = _wav_layout(file_path) if file_path.lower().endswith(".wav") else None
+        if layout is not None:
+            format_tag, channels, rate, bits, offset, size = layout
+            if format_tag == 1 and bits == 16 and rate == sr:
+                available = os.path.getsize(file_path) - offset
+                pcm = np.memmap(file_path, dtype="<i2", mode="r", offset=offset,
+                                shape=(min(size, available) // (2 * channels), channels))
+                if channels == 1:
+                    return _pcm16_to_float(pcm[:, 0]), sr
+                return (pcm.mean(axis=1, dtype=np.float32) / 32768.0), sr
+        backend = "ffmpeg" if shutil.which("ffmpeg") else "legacy"
+
+    if backend == "ffmpeg":
+        raw = subprocess.run(_ffmpeg_decode_command(file_path, sr), stdout=subprocess.PIPE, check=True).stdout
+        return _pcm16_to_float(np.frombuffer(raw, dtype=np.int16, count=len(raw) // 2)), sr
 
-def load_audio(file_path, sr=16000):
-    """ MP3 または WAV を読み込んで numpy 配列に変換 """
     if file_path.lower().endswith(".mp3"):
+        from pydub import AudioSegment
+
         audio = AudioSegment.from_mp3(file_path)
         audio = audio.set_channels(1).set_frame_rate(sr)  # モノラル化＆サンプリングレート変更
         samples = np.array(audio.get_array_of_samples(), dtype=np.float32) / 32768.0
     else:
+        import librosa
+
         samples, _ = librosa.load(file_path, sr=sr, mono=True)
 
     return samples, sr
 
-def noise_reduction(audio, sr):
-    """ ノイズ除去 """
-    return nr.reduce_noise(y=audio, sr=sr)
+def noise_reduction(audio, sr, noise_profile=None, n_jobs=1):
+    """
+    ノイズ除去。noise_profile（雑音だけの音声）を渡すと、その統計を閾値にする定常モードで処理する。
+    n_jobs で noisereduce のブロック単位の並列数を指定する（-1 で全コア）。
+    """
+    import noisereduce as nr
+
+    if noise_profile is None:
+        return nr.reduce_noise(y=audio, sr=sr, n_jobs=n_jobs)
+    return nr.reduce_noise(y=audio, sr=sr, stationary=True, y_noise=noise_profile, n_jobs=n_jobs)
+
+def estimate_noise_profile(audio, sr, max_seconds=30, min_seconds=1, guard_ms=150):
+    """
+    VAD で発話と判定されなかった区間を集めて雑音のプロファイルとする。
+    発話を取りこぼさないよう最も緩い判定を使い、発話区間の前後 guard_ms も除く。
+    雑音区間が min_seconds に満たなければ None を返す。
+    """
+    segments = vad_segments(audio, sr, aggressiveness=0, padding_ms=guard_ms)
+    gaps = np.concatenate(([0], segments.ravel(), [len(audio)])).reshape(-1, 2)
+    gaps = gaps[gaps[:, 1] > gaps[:, 0]]
+    noise = extract_segments(np.asarray(audio, dtype=np.float32), gaps)[:int(sr * max_seconds)]
+    if len(noise) < sr * min_seconds:
+        return None
+    return noise
+
+def file_fingerprint(file_path):
+    """ ファイル内容の SHA-256 による識別子 """
+    return f"file-{fileutil.file_digest(file_path)}"
+
+class NoiseProfileCache:
+    """
+    雑音プロファイルを機器・部屋の ID（またはファイルのフィンガープリント）とサンプリングレートごとに保存する。
+    保存するのは max_entries 個までで、読み込むと更新時刻を新しくし、使われていないものから削除する。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_NOISE_PROFILE_DIR, max_entries=NOISE_PROFILE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+
+    def _path(self, key, sr):
+        name = re.sub(r"[^\w.-]", "_", key)
+        return os.path.join(self.cache_dir, f"{name}-{sr}.npy")
+
+    def get(self, key, sr):
+        path = self._path(key, sr)
+        try:
+            profile = np.load(path)
+            os.utime(path)
+            return profile
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, sr, profile):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key, sr)
+        with fileutil.atomic_write(path, "wb") as f:
+            np.save(f, profile)
+        fileutil.prune_cache(self.cache_dir, self.max_entries, ".npy")
+
+    def get_or_estimate(self, key, audio, sr):
+        """ キャッシュになければ audio から推定して保存する（推定できなければ None） """
+        profile = self.get(key, sr)
+        if profile is None:
+            profile = estimate_noise_profile(audio, sr)
+            if profile is None:
+                print(f"雑音区間が足りないため、雑音プロファイルを使わずに処理します: {key}")
+            else:
+                self.put(key, sr, profile)
+        return profile
 
 def bandpass_filter(audio, sr, lowcut=300, highcut=3400):
     """ バンドパスフィルタで人間の声を強調 """
+    import scipy.signal as signal
+
     nyquist = sr / 2
     b, a = signal.butter(6, [lowcut / nyquist, highcut / nyquist], btype='band')
     return signal.filtfilt(b, a, audio)
 
-def vad_filter(audio, sr, frame_ms=30):
-    """ VAD（音声区間検出）で人間の声だけを抽出 """
-    vad = webrtcvad.Vad(2)
+def _to_int16(audio):
+    """ float 音声を int16 PCM に一括変換（範囲外はクリップ） """
+    return (np.clip(audio, -1.0, 32767 / 32768) * 32768).astype(np.int16)
+
+def vad_segments(audio, sr, frame_ms=30, aggressiveness=2, hangover_frames=0, padding_ms=0):
+    """
+    VAD（音声区間検出）で発話区間を検出し、(start, end) のサンプル番号の配列を返す。
+    hangover_frames で発話終了後のフレームを延長し、padding_ms で区間の前後を広げる。
+    """
+    import webrtcvad
+
+    vad = webrtcvad.Vad(aggressiveness)
     frame_size = int(sr * frame_ms / 1000)
+    n_frames = len(audio) // frame_size
+
+    # 全体を一度だけ int16 に変換し、フレームはコピーなしの memoryview で渡す
+    raw = memoryview(_to_int16(audio[:n_frames * frame_size])).cast("B")
+    frame_bytes = frame_size * 2
+    flags = np.fromiter(
+        (vad.is_speech(raw[i * frame_bytes:(i + 1) * frame_bytes], sr) for i in range(n_frames)),
+        dtype=bool,
+        count=n_frames,
+    )
+
+    if hangover_frames:
+        speech = flags.copy()
+        for k in range(1, hangover_frames + 1):
+            flags[k:] |= speech[:-k]
 
-    filtered_audio = []
-    for i in range(0, len(audio) - frame_size, frame_size):
-        frame = audio[i:i+frame_size]
-        raw_frame = struct.pack("%dh" % len(frame), *(np.int16(frame * 32768)))
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], flags.astype(np.int8), [0]))))
+    starts = edges[0::2] * frame_size
+    ends = edges[1::2] * frame_size
 
-        if vad.is_speech(raw_frame, sr):
-            filtered_audio.extend(frame)
+    if padding_ms and len(starts):
+        pad = int(sr * padding_ms / 1000)
+        starts = np.maximum(starts - pad, 0)
+        ends = np.minimum(ends + pad, len(audio))
+        # パディングで重なった区間を結合
+        is_new = np.concatenate(([True], starts[1:] > ends[:-1]))
+        starts = starts[is_new]
+        ends = ends[np.concatenate((is_new[1:], [True]))]
 
-    return np.array(filtered_audio)
+    return np.column_stack((starts, ends)).astype(np.int64)
+
+def extract_segments(audio, segments):
+    """ 発話区間だけを事前確保したバッファに詰めて返す """
+    lengths = segments[:, 1] - segments[:, 0]
+    filtered_audio = np.empty(int(lengths.sum()), dtype=audio.dtype)
+    pos = 0
+    for (start, end), length in zip(segments, lengths):
+        filtered_audio[pos:pos + length] = audio[start:end]
+        pos += length
+    return filtered_audio
+
+def vad_filter(audio, sr, frame_ms=30, aggressiveness=2, hangover_frames=0, padding_ms=0, return_segments=False):
+    """ VAD（音声区間検出）で人間の声だけを抽出 """
+    audio = np.asarray(audio)
+    segments = vad_segments(audio, sr, frame_ms, aggressiveness, hangover_frames, padding_ms)
+    filtered_audio = extract_segments(audio, segments)
+    if return_segments:
+        return filtered_audio, segments
+    return filtered_audio
 
 def save_audio(file_path, audio, sr, format="wav"):
     """ 音声データを WAV または MP3 で保存 """
+    from pydub import AudioSegment
+
     audio_segment = AudioSegment(
         (audio * 32768).astype(np.int16).tobytes(),
         frame_rate=sr,
@@ -57,14 +321,249 @@ def save_audio(file_path, audio, sr, format="wav"):
     else:
         audio_segment.export(file_path, format="wav")
 
-# 音声処理の実行
-input_file = "/Users/murakaminaoya/Downloads/audio.mp3"  # MP3 でも WAV でもOK
-output_file = "output.mp3"  # MP3 で出力
+def stream_pcm16(file_path, sr=16000, block_size=16000 * 30):
+    """ ffmpeg でデコードしたモノラル s16le PCM を block_size サンプルずつ bytes で返す """
+    process = subprocess.Popen(_ffmpeg_decode_command(file_path, sr), stdout=subprocess.PIPE)
+    try:
+        while True:
+            raw = process.stdout.read(block_size * 2)
+            if not raw:
+                break
+            yield raw
+    finally:
+        process.stdout.close()
+        process.wait()
+    if process.returncode:
+        raise RuntimeError(f"ffmpeg によるデコードに失敗しました: {file_path}")
+
+def stream_audio(file_path, sr=16000, block_size=16000 * 30):
+    """ ffmpeg でデコードしたモノラル PCM を block_size サンプルずつ float32 で返す """
+    for raw in stream_pcm16(file_path, sr, block_size):
+        yield _pcm16_to_float(np.frombuffer(raw, dtype=np.int16, count=len(raw) // 2))
+
+def stream_noise_reduction(blocks, sr, block_size=16000 * 30, overlap=16000, noise_profile=None, n_jobs=1):
+    """ ブロック単位のノイズ除去（重なり部分はクロスフェードで重畳加算） """
+    hop = block_size - overlap
+    fade_in = np.linspace(0.0, 1.0, overlap, endpoint=False, dtype=np.float32)
+    fade_out = 1.0 - fade_in
+    pending = np.empty(0, dtype=np.float32)
+    tail = None  # 直前ブロックの重なり部分（未出力）
+
+    def overlap_add(out):
+        if tail is not None:
+            out[:overlap] = out[:overlap] * fade_in + tail * fade_out
+        return out
+
+    for block in blocks:
+        pending = np.concatenate((pending, block))
+        while len(pending) >= block_size:
+            out = overlap_add(noise_reduction(pending[:block_size], sr, noise_profile, n_jobs).astype(np.float32))
+            yield out[:hop]
+            tail = out[hop:]
+            pending = pending[hop:]
+
+    if tail is None:
+        if len(pending):
+            yield noise_reduction(pending, sr, noise_profile, n_jobs).astype(np.float32)
+    elif len(pending) > overlap:
+        yield overlap_add(noise_reduction(pending, sr, noise_profile, n_jobs).astype(np.float32))
+    else:
+        yield tail
+
+def stream_bandpass_filter(blocks, sr, lowcut=300, highcut=3400):
+    """ 状態 (zi) を引き継ぐ SOS フィルタでブロックごとにバンドパスをかける """
+    import scipy.signal as signal
+
+    nyquist = sr / 2
+    sos = signal.butter(6, [lowcut / nyquist, highcut / nyquist], btype='band', output='sos')
+    zi = None
+    for block in blocks:
+        if not len(block):
+            continue
+        if zi is None:
+            zi = signal.sosfilt_zi(sos) * block[0]
+        filtered, zi = signal.sosfilt(sos, block, zi=zi)
+        yield filtered.astype(np.float32)
+
+def stream_vad_filter(blocks, sr, frame_ms=30, aggressiveness=2):
+    """ フレーム境界に揃えたブロックごとに VAD をかける """
+    frame_size = int(sr * frame_ms / 1000)
+    pending = np.empty(0, dtype=np.float32)
+    for block in blocks:
+        pending = np.concatenate((pending, block))
+        aligned = len(pending) // frame_size * frame_size
+        if aligned:
+            yield vad_filter(pending[:aligned], sr, frame_ms, aggressiveness)
+            pending = pending[aligned:]
+
+def save_audio_stream(file_path, blocks, sr, format="wav"):
+    """ ブロックを受け取り次第 WAV または MP3 に逐次書き出す """
+    if format == "mp3":
+        command = [
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+            "-f", "s16le", "-ac", "1", "-ar", str(sr), "-i", "pipe:0",
+            "-b:a", "192k", file_path,
+        ]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        try:
+            for block in blocks:
+                process.stdin.write(_to_int16(block).tobytes())
+        finally:
+            process.stdin.close()
+            process.wait()
+        if process.returncode:
+            raise RuntimeError(f"ffmpeg によるエンコードに失敗しました: {file_path}")
+    else:
+        with wave.open(file_path, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sr)
+            for block in blocks:
+                wf.writeframes(_to_int16(block).tobytes())
+
+def process_stream(input_file, output_file, sr=16000, block_seconds=30, overlap_seconds=1, format="wav",
+                   noise_profile_key=None, noise_profile_cache=None, noise_jobs=1):
+    """
+    デコード・ノイズ除去・バンドパス・VAD をブロック単位で行う（メモリ使用量は入力長に依存しない）。
+    雑音プロファイルがキャッシュになければ最初のブロックから推定する。
+    """
+    block_size = int(sr * block_seconds)
+    blocks = stream_audio(input_file, sr, block_size)
+    noise_profile = None
+    if noise_profile_key:
+        first = next(blocks, None)
+        if first is not None:
+            noise_profile = noise_profile_cache.get_or_estimate(noise_profile_key, first, sr)
+            blocks = itertools.chain([first], blocks)
+    blocks = stream_noise_reduction(blocks, sr, block_size, int(sr * overlap_seconds), noise_profile, noise_jobs)
+    blocks = stream_bandpass_filter(blocks, sr)
+    blocks = stream_vad_filter(blocks, sr)
+    save_audio_stream(output_file, blocks, sr, format=format)
+
+def process_file(input_file, output_file, format="wav", stream=False, noise_profile=None, noise_jobs=1,
+                 noise_profile_dir=DEFAULT_NOISE_PROFILE_DIR):
+    """
+    1 ファイル分の前処理（読み込み → ノイズ除去 → バンドパス → VAD → 保存）。
+    noise_profile に機器・部屋の ID（"file" ならファイルのフィンガープリント）を渡すと、
+    その ID でキャッシュした雑音プロファイルを使う（なければ推定して保存する）。
+    """
+    cache = NoiseProfileCache(noise_profile_dir) if noise_profile else None
+    key = file_fingerprint(input_file) if noise_profile == "file" else noise_profile
+    if stream:
+        # ストリーミングでは各段階が交互に進むため、まとめて 1 段階として計測する
+        with metrics.stage("process_stream", file=input_file):
+            process_stream(input_file, output_file, format=format,
+                           noise_profile_key=key, noise_profile_cache=cache, noise_jobs=noise_jobs)
+        return output_file
+    with metrics.stage("decode", file=input_file):
+        audio, sr = load_audio(input_file)
+    noise = None
+    if key:
+        with metrics.stage("noise_profile", file=input_file):
+            noise = cache.get_or_estimate(key, audio, sr)
+    with metrics.stage("noise_reduction", file=input_file):
+        audio = noise_reduction(audio, sr, noise, noise_jobs)
+    with metrics.stage("bandpass", file=input_file):
+        audio = bandpass_filter(audio, sr)
+    with metrics.stage("vad", file=input_file):
+        audio = vad_filter(audio, sr)
+    with metrics.stage("encode", file=input_file):
+        save_audio(output_file, audio, sr, format=format)
+    return output_file
+
+def collect_inputs(patterns, extensions=(".mp3", ".wav")):
+    """ ディレクトリまたは glob パターンから入力ファイルを集める """
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = (os.path.join(pattern, name) for name in os.listdir(pattern))
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        files.update(
+            os.path.normpath(path) for path in candidates
+            if os.path.isfile(path) and path.lower().endswith(extensions)
+        )
+    return sorted(files)
+
+def output_paths(input_files, output_dir, format):
+    """
+    入力ごとの出力パス <output_dir>/<stem>.<format> を返す。
+    別の入力と同じ出力になるもの（a/x.mp3 と b/x.mp3、x.wav と x.mp3 など）や、
+    入力そのものを上書きしてしまうものがあれば ValueError を送出する。
+    """
+    pairs = []
+    sources = {}
+    for input_file in input_files:
+        stem = os.path.splitext(os.path.basename(input_file))[0]
+        output_file = os.path.join(output_dir, f"{stem}.{format}")
+        pairs.append((input_file, output_file))
+        sources.setdefault(os.path.abspath(output_file), []).append(input_file)
+    inputs = {os.path.abspath(input_file) for input_file in input_files}
+    problems = [f"{output_file} <- {', '.join(files)}" for output_file, files in sources.items() if len(files) > 1]
+    problems += [f"{output_file} は入力ファイルそのものです" for output_file in sources if output_file in inputs]
+    if problems:
+        raise ValueError("出力ファイルが衝突します:\n  " + "\n  ".join(problems))
+    return pairs
+
+def is_up_to_date(input_file, output_file):
+    """ 出力が入力より新しければ処理済みとみなす """
+    return os.path.exists(output_file) and os.path.getmtime(output_file) >= os.path.getmtime(input_file)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="音声ファイルをノイズ除去・バンドパス・VAD で前処理する")
+    parser.add_argument("inputs", nargs="+", help="入力ファイル・ディレクトリ・glob パターン")
+    parser.add_argument("-o", "--output_dir", default=".", help="出力ディレクトリ")
+    parser.add_argument("-f", "--format", choices=["wav", "mp3"], default="mp3", help="出力フォーマット")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="並列プロセス数")
+    parser.add_argument("--stream", action="store_true", help="ブロック単位のストリーミング処理でメモリ使用量を抑える")
+    parser.add_argument("--force", action="store_true", help="処理済みの出力も作り直す")
+    parser.add_argument("--noise_profile", help="雑音プロファイルをこの機器・部屋の ID でキャッシュして使い回す（file ならファイルごと）")
+    parser.add_argument("--noise_profile_dir", default=DEFAULT_NOISE_PROFILE_DIR, help="雑音プロファイルの保存先")
+    parser.add_argument("--noise_jobs", type=int, default=1, help="ノイズ除去のブロック並列数（-1 で全コア。-j と掛け合わせた数のプロセスが動く）")
+    parser.add_argument("--metrics", help="段階ごとの計測結果の出力先（.prom なら Prometheus textfile、それ以外は JSON Lines）")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    try:
+        pairs = output_paths(collect_inputs(args.inputs), args.output_dir, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs = []
+    for input_file, output_file in pairs:
+        if not args.force and is_up_to_date(input_file, output_file):
+            print(f"スキップ（処理済み）: {input_file}")
+            continue
+        jobs.append((input_file, output_file))
+
+    # 長いファイルから先に投入し、最後に 1 本だけ残って待たされるのを防ぐ（長さはヘッダから求める）
+    jobs.sort(key=lambda job: estimated_duration(job[0]), reverse=True)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        # 計測が有効なら子プロセスのイベントを戻り値で受け取り、親プロセスでまとめて書き出す
+        submit = ((lambda *args: executor.submit(metrics.run_collected, process_file, *args))
+                  if metrics.is_enabled() else (lambda *args: executor.submit(process_file, *args)))
+        futures = {
+            submit(input_file, output_file, args.format, args.stream, args.noise_profile, args.noise_jobs,
+                   args.noise_profile_dir): input_file
+            for input_file, output_file in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+                if metrics.is_enabled():
+                    result, events = result
+                    metrics.merge(events)
+                print(f"処理が完了しました: {result}")
+            except Exception as e:
+                failed += 1
+                print(f"処理に失敗しました: {futures[future]}: {e}")
 
-audio, sr = load_audio(input_file)
-audio = noise_reduction(audio, sr)
-audio = bandpass_filter(audio, sr)
-audio = vad_filter(audio, sr)
-save_audio(output_file, audio, sr, format="mp3")
+    if failed:
+        exit(1)
 
-print(f"処理が完了しました: {output_file}")
+if __name__ == "__main__":
+    main()
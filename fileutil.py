@@ -0,0 +1,51 @@
+import contextlib
+import hashlib
+import os
+import threading
+from typing import IO, Iterator, Optional
+
+
+def file_digest(path: str) -> str:
+    """ ファイル内容の SHA-256（16 進文字列）。大きなファイルも 1 MiB ずつ読む """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def prune_cache(cache_dir: str, max_entries: int, suffix: str) -> None:
+    """ cache_dir 内の suffix で終わるファイルのうち、更新時刻が新しい max_entries 個を残して削除する """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(suffix):
+            try:
+                entries.append((entry.stat().st_mtime_ns, entry.path))
+            except OSError:
+                pass
+    entries.sort(reverse=True)
+    for _, path in entries[max_entries:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@contextlib.contextmanager
+def atomic_write(path: str, mode: str = 'w', encoding: Optional[str] = None) -> Iterator[IO]:
+    """
+    一時ファイルに書き込み、ブロックを抜けたときに os.replace で path に置き換える。
+    読み手が書きかけの内容を見ることはなく、例外時は一時ファイルを消して path を元のまま残す。
+    一時ファイル名にはプロセス ID とスレッド ID を含めるので、同じ path への並行書き込みでも衝突しない。
+    """
+    if encoding is None and 'b' not in mode:
+        encoding = 'utf-8'
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
@@ -1,8 +1,16 @@
 #!/usr/bin/env python3
 import argparse
+import bisect
+import collections
+import functools
+import itertools
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from openai import OpenAI
+import metrics
 
 # tiktokenがインストールされていれば利用。なければ簡易計算を行う。
 try:
@@ -11,41 +19,100 @@ except ImportError:
     tiktoken = None
     print("tiktokenがインストールされていません。トークン数のカウントは簡易計算で行います。")
 
-def split_text_by_tokens(text, max_tokens_per_segment, model="gpt-4o-mini"):
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """モデルごとのエンコーダを一度だけ生成して再利用する。"""
+    return tiktoken.encoding_for_model(model)
+
+def token_byte_offsets(text, model="gpt-4o-mini"):
     """
-    入力テキストをトークン数に基づいてセグメントに分割する関数。
-    Whisperの文字起こしファイルは改行ごとに分割し、
-    セグメントが max_tokens_per_segment を超えたら改段する。
+    テキストを一度だけエンコードし、UTF-8 での各トークンの開始バイト位置（末尾は全長）を返す。
+    tiktoken がない場合は 1トークン＝約4文字として近似する。
     """
-    segments = []
-    current_segment = ""
-
     if tiktoken:
-        encoding = tiktoken.encoding_for_model(model)
-        def count_tokens(s):
-            c = len(encoding.encode(s))
-            print(f"トークン数: {c}")
-            return c
+        encoding = get_encoding(model)
+        lengths = map(len, encoding.decode_tokens_bytes(encoding.encode_ordinary(text)))
     else:
         # おおよその推定：1トークン＝約4文字
-        def count_tokens(s):
-            c = len(s) // 4
-            print(f"トークン数: {c}")
-            return c
-
-    for line in text.split(" "):
-        if not line.strip():
-            continue  # 空行はスキップ
-        # 現在のセグメントにこの行を追加した場合のトークン数が上限を超えるか確認
-        if count_tokens(current_segment + line) > max_tokens_per_segment:
-            segments.append(current_segment)
-            current_segment = line + "\n"
-        else:
-            current_segment += line + "\n"
-    if current_segment:
-        segments.append(current_segment)
+        lengths = (len(m.group().encode("utf-8")) for m in re.finditer(".{1,4}", text, re.S))
+    return list(itertools.accumulate(lengths, initial=0))
+
+def split_text_by_tokens(text, max_tokens_per_segment, model="gpt-4o-mini", boundaries=("。", "\n"),
+                         with_token_counts=False):
+    """
+    入力テキストをトークン数に基づいてセグメントに分割する関数。
+    Whisperの文字起こしファイルは空白ごとに改行し、全体を一度だけエンコードして
+    トークン位置でセグメントを切り出す。boundaries を指定すると、上限の後半にある
+    区切り文字（先に指定したものを優先）の直後で切る。
+    with_token_counts=True の場合は (セグメント, トークン数) のリストを返す。
+    """
+    text = "".join(word + "\n" for word in text.split(" ") if word.strip())
+    data = text.encode("utf-8")
+    offsets = token_byte_offsets(text, model=model)
+    n_tokens = len(offsets) - 1
+
+    # 区切り文字の直後のバイト位置（昇順）
+    cut_points = [
+        [m.end() for m in re.finditer(re.escape(boundary.encode("utf-8")), data)]
+        for boundary in (boundaries or ())
+    ]
+
+    segments = []
+    token_counts = []
+    pos = 0
+    while pos < len(data):
+        start = bisect.bisect_left(offsets, pos)
+        end = min(start + max_tokens_per_segment, n_tokens)
+        cut = offsets[end]
+        if end < n_tokens:
+            lower = offsets[start + max_tokens_per_segment // 2]
+            for points in cut_points:
+                i = bisect.bisect_right(points, cut) - 1
+                if i >= 0 and points[i] > lower:
+                    cut = points[i]
+                    break
+            else:
+                # トークン境界が文字の途中にある場合は文字境界まで戻す
+                while cut > pos and data[cut] & 0xC0 == 0x80:
+                    cut -= 1
+                while cut == pos or (cut < len(data) and data[cut] & 0xC0 == 0x80):
+                    cut += 1
+        segments.append(data[pos:cut].decode("utf-8"))
+        token_counts.append(bisect.bisect_left(offsets, cut) - start)
+        pos = cut
+    if with_token_counts:
+        return list(zip(segments, token_counts))
     return segments
 
+class RateLimiter:
+    """
+    1分間のスライディングウィンドウでリクエスト数 (RPM) とトークン数 (TPM) を制限する。
+    0 または None の項目は制限しない。スレッドセーフ。
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._events = collections.deque()  # (時刻, トークン数)
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        """予算に空きができるまで待ってから、リクエスト1件分を確保する。"""
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._events and self._events[0][0] <= now - 60:
+                    self._tokens -= self._events.popleft()[1]
+                within_rpm = not self.requests_per_minute or len(self._events) < self.requests_per_minute
+                within_tpm = (not self.tokens_per_minute or not self._events
+                              or self._tokens + tokens <= self.tokens_per_minute)
+                if within_rpm and within_tpm:
+                    self._events.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                time.sleep(self._events[0][0] + 60 - now)
+
 def format_segment(client, segment, model="gpt-4o-mini", temperature=0.3):
     """
     OpenAI APIを使って、セグメントの文章を読みやすい日本語に整形する関数。
@@ -57,32 +124,44 @@ def format_segment(client, segment, model="gpt-4o-mini", temperature=0.3):
         {"role": "user", "content": prompt}
     ]
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-        )
+        with metrics.api_call("openai.chat.completions", model=model) as call:
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+            )
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                call["tokens_in"] = usage.prompt_tokens
+                call["tokens_out"] = usage.completion_tokens
     except Exception as e:
         print("API呼び出し中にエラーが発生しました:", e)
         raise e
     formatted_text = response.choices[0].message.content.strip()
     return formatted_text
 
-def main(client, input_file, output_file, max_tokens_per_segment=8000, model="gpt-4o-mini"):
+def main(client, input_file, output_file, max_tokens_per_segment=8000, model="gpt-4o-mini",
+         concurrency=4, requests_per_minute=None, tokens_per_minute=None):
     # 1. 入力ファイルの読み込み
     with open(input_file, "r", encoding="utf-8") as f:
         text = f.read()
 
     # 2. テキストをセグメントに分割（コンテキストウィンドウに合わせる）
-    segments = split_text_by_tokens(text, max_tokens_per_segment, model=model)
+    with metrics.stage("split"):
+        segments = split_text_by_tokens(text, max_tokens_per_segment, model=model, with_token_counts=True)
     print(f"全{len(segments)}セグメントに分割しました。")
 
-    formatted_segments = []
-    # 3. 各セグメントをOpenAI APIで整形
-    for i, segment in enumerate(segments):
+    # 3. 各セグメントをOpenAI APIで整形（並列数とRPM/TPMの予算内で同時実行）
+    # TPM には入力に加えて同程度の出力トークンが計上されるため、入力トークン数の2倍で見積もる
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    def run(i, segment, n_tokens):
+        limiter.acquire(n_tokens * 2)
         print(f"セグメント {i+1}/{len(segments)} を整形中...")
-        formatted_text = format_segment(client, segment, model=model)
-        formatted_segments.append(formatted_text)
+        return format_segment(client, segment, model=model)
+
+    with metrics.stage("format"), ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        formatted_segments = list(executor.map(run, range(len(segments)), *zip(*segments)))
 
     # 4. 整形済みセグメントを統合し、出力ファイルに保存
     final_text = "\n\n".join(formatted_segments)
@@ -90,7 +169,7 @@ def main(client, input_file, output_file, max_tokens_per_segment=8000, model="gp
         f.write(final_text)
     print(f"整形した文章を {output_file} に保存しました。")
 
-if __name__ == "__main__":
+def cli(argv=None):
     parser = argparse.ArgumentParser(
         description="Whisperの文字起こしファイルを読みやすく整形するスクリプト"
     )
@@ -98,10 +177,21 @@ if __name__ == "__main__":
     parser.add_argument("output_file", help="出力ファイルのパス")
     parser.add_argument("--max_tokens", type=int, default=8000, help="セグメントごとの最大トークン数")
     parser.add_argument("--model", type=str, default="gpt-4o-mini", help="使用するOpenAIモデル")
-    args = parser.parse_args()
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に整形するセグメント数")
+    parser.add_argument("--rpm", type=int, default=0, help="1分あたりの最大リクエスト数（0は無制限）")
+    parser.add_argument("--tpm", type=int, default=0, help="1分あたりの最大トークン数（0は無制限）")
+    parser.add_argument("--metrics", help="段階ごと・API 呼び出しごとの計測結果の出力先（.prom なら Prometheus textfile、それ以外は JSON Lines）")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    from openai import OpenAI
 
     client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),  # This is the default and can be omitted
+        api_key=os.environ.get("OPENAI_API_KEY"),  # This is the default and can be omitted
     )
-    main(client, args.input_file, args.output_file, max_tokens_per_segment=args.max_tokens, model=args.model)
+    main(client, args.input_file, args.output_file, max_tokens_per_segment=args.max_tokens, model=args.model,
+         concurrency=args.concurrency, requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
 
+if __name__ == "__main__":
+    cli()
@@ -1,24 +1,143 @@
 import argparse
 import csv
-import re
+import io
+import zipfile
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
-parser = argparse.ArgumentParser(description='Generate columns from mermaid')
-parser.add_argument('--input_file', '-i', type=str, help='input file path')
-parser.add_argument('--output_file', '-o', type=str, help='output file path')
-args = parser.parse_args()
+FIELDS = ('logical_name', 'component_type', 'format', 'size')
+# 見出しが見つからない項目は、これまでどおり列の位置で拾う
+LEGACY_POSITIONS = {'logical_name': 0, 'component_type': 1, 'format': 3, 'size': 4}
+HEADER_ALIASES = {
+    'logical_name': ('名前', '論理名', 'Name'),
+    'component_type': ('種別', 'コンポーネント', 'Type'),
+    'format': ('形式', 'フォーマット', 'Format'),
+    'size': ('サイズ', '桁数', 'Size'),
+}
 
 
-with open(args.input_file, newline='') as f:
-    reader = csv.reader(f, delimiter=',')
-    header = next(reader)
-    rows = []
+def resolve_columns(header: Sequence[str], headers: Optional[Dict[str, str]] = None) -> List[int]:
+    """
+    Resolve the index of each field from the export header once, before reading the rows.
+
+    Fields named with headers must be present. The other fields are looked up by HEADER_ALIASES,
+    all or nothing: if any of them is not found, all of them use LEGACY_POSITIONS instead, so a
+    partial match never mixes header-addressed and positional columns.
+    Raises ValueError if two fields resolve to the same column.
+    """
+    names = [name.strip().lstrip('\ufeff') for name in header]
+    headers = headers or {}
+    indexes = {}
+    for field, name in headers.items():
+        if name not in names:
+            raise ValueError(f'Header {name!r} for {field} not found in {names}')
+        indexes[field] = names.index(name)
+    aliased = {
+        field: next((names.index(name) for name in HEADER_ALIASES[field] if name in names), None)
+        for field in FIELDS if field not in headers
+    }
+    if None in aliased.values():
+        aliased = {field: LEGACY_POSITIONS[field] for field in aliased}
+    indexes.update(aliased)
+
+    shared = {index: [field for field in FIELDS if indexes[field] == index] for index in indexes.values()}
+    conflicts = {index: fields for index, fields in shared.items() if len(fields) > 1}
+    if conflicts:
+        details = ', '.join(f'{" and ".join(fields)} -> column {index}' for index, fields in conflicts.items())
+        raise ValueError(f'Fields share a column ({details}) in {names}; pass --header FIELD=HEADER to disambiguate')
+    return [indexes[field] for field in FIELDS]
+
+
+def _rows_to_fields(reader, headers: Optional[Dict[str, str]] = None) -> Iterator[List[str]]:
+    header = next(reader, None)
+    if header is None:
+        return
+    logical_name, component_type, format, size = resolve_columns(header, headers)
     for row in reader:
-        logical_name = row[0]
-        component_type = row[1].split(' ')[0]
-        format = row[3].split(' ')[0]
-        size = row[4]
-        rows.append(','.join([logical_name, component_type, format, size]))
-
-with open(args.output_file, 'w') as f:
-    for row in rows:
-        f.write(f'{row}\n')
+        if not row:
+            continue
+        yield [
+            row[logical_name],
+            row[component_type].split(' ')[0],
+            row[format].split(' ')[0],
+            row[size],
+        ]
+
+
+def notion_database_to_fields(file: str, headers: Optional[Dict[str, str]] = None) -> Iterator[List[str]]:
+    with open(file, newline='', encoding='utf-8-sig') as f:
+        yield from _rows_to_fields(csv.reader(f), headers)
+
+
+def iter_notion_exports(paths: Sequence[str]) -> Iterator[Tuple[str, io.TextIOBase]]:
+    """ Yield (source name, text stream) for each CSV file, including CSV members of zipped exports """
+    for path in paths:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                for member in archive.namelist():
+                    if not member.lower().endswith('.csv'):
+                        continue
+                    with archive.open(member) as raw:
+                        yield f'{path}:{member}', io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+        else:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                yield path, f
+
+
+def notion_exports_to_csv(paths: Sequence[str], output, headers: Optional[Dict[str, str]] = None,
+                          source_column: bool = False) -> int:
+    """
+    Stream rows from Notion exports into output through csv.writer, one row at a time.
+    Returns the number of rows written.
+    """
+    writer = csv.writer(output, lineterminator='\n')
+    count = 0
+    for source, stream in iter_notion_exports(paths):
+        for fields in _rows_to_fields(csv.reader(stream), headers):
+            writer.writerow([source, *fields] if source_column else fields)
+            count += 1
+    return count
+
+
+def notion_database_to_rows(file: str) -> [str]:
+    return [','.join(fields) for fields in notion_database_to_fields(file)]
+
+
+def _parse_headers(values: Optional[List[str]]) -> Optional[Dict[str, str]]:
+    if not values:
+        return None
+    headers = {}
+    for value in values:
+        field, _, name = value.partition('=')
+        if field not in FIELDS or not name:
+            raise argparse.ArgumentTypeError(f'expected FIELD=HEADER with FIELD in {", ".join(FIELDS)}: {value}')
+        headers[field] = name
+    return headers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate columns from Notion database exports')
+    parser.add_argument('--input_file', '-i', type=str, nargs='+', help='input file path(s): Notion export CSV files or zipped exports')
+    parser.add_argument('--output_file', '-o', type=str, help='output file path')
+    parser.add_argument('--header', action='append', metavar='FIELD=HEADER',
+                        help=f'header name of a field ({", ".join(FIELDS)}); repeatable')
+    parser.add_argument('--source_column', action='store_true',
+                        help='prefix each row with its source file (default when several files or a zip are given)')
+    args = parser.parse_args(argv)
+
+    try:
+        headers = _parse_headers(args.header)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    source_column = (args.source_column or len(args.input_file) > 1
+                     or any(zipfile.is_zipfile(path) for path in args.input_file))
+
+    with open(args.output_file, 'w', newline='', encoding='utf-8') as f:
+        try:
+            count = notion_exports_to_csv(args.input_file, f, headers, source_column)
+        except ValueError as e:
+            parser.error(str(e))
+    if source_column:
+        print(f'{count} rows from {len(args.input_file)} inputs')
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,24 @@
 import argparse
-import re
 
+# parse_text はここでは使わないが、以前からこのモジュールの parse_text を import している呼び出し元のために再エクスポートする
+from mermaid_parser import DEFAULT_CACHE_DIR, parse_file, parse_text, table_names
 
-def parse_text(target_string: str) -> (str, str):
-    pattern = re.compile(r'[^"]*"(?P<logical_name>[^(]+)\s*\((?P<physical_name>[^)]+)\)" {')
-    result = pattern.search(target_string)
-    if result is None:
-        return None
-    return (result.group('physical_name'), result.group('logical_name'))
 
-parser = argparse.ArgumentParser(description='Generate columns from mermaid')
-parser.add_argument('--input_file', '-i', type=str, help='input file path')
-parser.add_argument('--output_file', '-o', type=str, help='output file path')
-args = parser.parse_args()
+def mermaid_to_table_names(file: str, cache_dir: str = DEFAULT_CACHE_DIR) -> dict:
+    return table_names(parse_file(file, cache_dir=cache_dir))
 
-names = []
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate columns from mermaid')
+    parser.add_argument('--input_file', '-i', type=str, help='input file path')
+    parser.add_argument('--output_file', '-o', type=str, help='output file path')
+    parser.add_argument('--no_cache', action='store_true', help='do not use the parse cache')
+    args = parser.parse_args(argv)
 
-with open(args.input_file, 'r') as f:
-  for line in f:
-      parsed = parse_text(line)
-      if parsed is not None:
-        names.append(parsed)
-table_dict = dict(names)
+    table_dict = mermaid_to_table_names(args.input_file, cache_dir=None if args.no_cache else DEFAULT_CACHE_DIR)
 
-with open(args.output_file, 'w') as f:
-   for key, value in table_dict.items():
-         f.write(f'{key}, {value}\n')
+    with open(args.output_file, 'w') as f:
+        for key, value in table_dict.items():
+            f.write(f'{key}, {value}\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import inflection
+
+DEFAULT_GLOSSARY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "tools", "glossary.sqlite3")
+
+
+class Glossary:
+    """
+    Persistent glossary of Japanese terms and their snake_case translations, shared across runs.
+
+    Lookups try an exact match first. Failing that, the term is segmented into known
+    sub-terms with a trie (fewest pieces wins) and their translations are joined, e.g.
+    作成日時 from 作成 + 日時. Hits and misses are counted per run and cumulatively.
+    """
+
+    def __init__(self, path: str = DEFAULT_GLOSSARY_PATH, min_subterm_length: int = 2):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.min_subterm_length = min_subterm_length
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS terms (
+                japanese TEXT PRIMARY KEY,
+                english TEXT NOT NULL,
+                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                count INTEGER NOT NULL
+            );
+        """)
+        self.counts = {"exact": 0, "composed": 0, "miss": 0}
+        self._trie = None
+
+    def _build_trie(self) -> dict:
+        trie = {}
+        for japanese, english in self.connection.execute(
+                "SELECT japanese, english FROM terms WHERE length(japanese) >= ?", (self.min_subterm_length,)):
+            node = trie
+            for char in japanese:
+                node = node.setdefault(char, {})
+            node[None] = english
+        return trie
+
+    def _compose(self, term: str) -> Optional[str]:
+        """Cover the whole term with known sub-terms using as few pieces as possible."""
+        if self._trie is None:
+            self._trie = self._build_trie()
+        n = len(term)
+        # best[i]: (piece count, translations) covering term[:i]
+        best: List[Optional[Tuple[int, List[str]]]] = [None] * (n + 1)
+        best[0] = (0, [])
+        for i in range(n):
+            if best[i] is None:
+                continue
+            node = self._trie
+            for j in range(i, n):
+                node = node.get(term[j])
+                if node is None:
+                    break
+                if None in node and (best[j + 1] is None or best[i][0] + 1 < best[j + 1][0]):
+                    best[j + 1] = (best[i][0] + 1, best[i][1] + [node[None]])
+        if best[n] is None or best[n][0] < 2:
+            return None
+        return "_".join(inflection.underscore(piece) for piece in best[n][1])
+
+    def lookup(self, term: str) -> Optional[str]:
+        row = self.connection.execute("SELECT english FROM terms WHERE japanese = ?", (term,)).fetchone()
+        if row is not None:
+            self._count("exact")
+            return row[0]
+        composed = self._compose(term)
+        if composed is not None:
+            self._count("composed")
+            return composed
+        self._count("miss")
+        return None
+
+    def add(self, term: str, english: str) -> None:
+        english = inflection.underscore(english)
+        self.connection.execute(
+            "INSERT INTO terms (japanese, english) VALUES (?, ?) "
+            "ON CONFLICT(japanese) DO UPDATE SET english = excluded.english, updated_at = CURRENT_TIMESTAMP",
+            (term, english))
+        self.connection.commit()
+        if self._trie is not None and len(term) >= self.min_subterm_length:
+            node = self._trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[None] = english
+
+    def _count(self, name: str) -> None:
+        self.counts[name] += 1
+        self.connection.execute(
+            "INSERT INTO stats (name, count) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET count = count + 1", (name,))
+
+    def stats(self) -> Dict[str, int]:
+        self.connection.commit()
+        return dict(self.connection.execute("SELECT name, count FROM stats"))
+
+    def report(self) -> str:
+        saved = self.counts["exact"] + self.counts["composed"]
+        total = saved + self.counts["miss"]
+        return (f"Glossary: {self.counts['exact']} exact, {self.counts['composed']} composed, "
+                f"{self.counts['miss']} misses ({saved}/{total} API calls saved)")
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect or edit the translation glossary')
+    parser.add_argument('--glossary', '-g', type=str, default=DEFAULT_GLOSSARY_PATH, help='glossary file path')
+    parser.add_argument('--add', nargs=2, metavar=('JAPANESE', 'ENGLISH'), help='add or update a term')
+    parser.add_argument('--lookup', type=str, help='look up a term')
+    args = parser.parse_args(argv)
+
+    glossary = Glossary(args.glossary)
+    if args.add:
+        glossary.add(*args.add)
+    if args.lookup:
+        print(glossary.lookup(args.lookup))
+    for name, count in sorted(glossary.stats().items()):
+        print(f'{name}: {count}')
+    glossary.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,19 @@
 import argparse
+import csv
+import glob
+import json
+import os
 import re
-from typing import Optional
+from typing import List, Optional
+
+from fileutil import atomic_write, file_digest
+
+MARKDOWN_HEADER_PATTERN = re.compile(r'#+ (.+)')
+TABLE_HEADER_PATTERN = re.compile(r'\| ID \| キー名 \| 名前 \|.*')
 
 
 def parse_markdown_header(target_string: str) -> Optional[str]:
-    pattern = re.compile(r'#+ (.+)')
-    match = pattern.match(target_string)
+    match = MARKDOWN_HEADER_PATTERN.match(target_string)
     if match:
         return match.group(1)
     else:
@@ -13,48 +21,125 @@ def parse_markdown_header(target_string: str) -> Optional[str]:
 
 
 def parse_table_header(target_string: str) -> bool:
-    pattern = re.compile(r'\| ID \| キー名 \| 名前 \|.*')
-    match = pattern.match(target_string)
+    match = TABLE_HEADER_PATTERN.match(target_string)
     if match:
         return True
     else:
         return False
 
-parser = argparse.ArgumentParser(description='Generate columns from mermaid')
-parser.add_argument('--input_file', '-i', type=str, help='input file path')
-parser.add_argument('--output_file', '-o', type=str, help='output file path')
-args = parser.parse_args()
-
-
-with open(args.input_file, 'r') as f:
-    logical_name = ''
-    table_name = ''
-    is_table = False
-    output_lines = []
-    for line in f:
-        parsed = parse_markdown_header(line)
-        if parsed is not None:
-            master_table_name = parsed
-            print(master_table_name)
-            table_name = ''
-            if '(' in master_table_name:
-                raw_name_parts = master_table_name.split('(')
-                logical_name = raw_name_parts[0]
-                table_name = raw_name_parts[1].replace(')', '')
-            else:
-                logical_name = master_table_name
-                table_name = 'None'
-            is_table = False
-        if '| --- | --- | --- |' in line:
-            continue
-        if is_table and '|' in line:
-            parts = line.split('|')
-            parts.insert(0, logical_name)
-            parts.insert(1, table_name)
-            output_lines.append(','.join([part.strip() for part in parts if part != '']))
-        if parse_table_header(line):
-            is_table = True
-
-with open(args.output_file, 'w') as f:
-    f.write('\n'.join(output_lines))
+def markdown_to_rows(file: str) -> List[List[str]]:
+    with open(file, 'r') as f:
+        logical_name = ''
+        table_name = ''
+        is_table = False
+        rows = []
+        for line in f:
+            parsed = parse_markdown_header(line)
+            if parsed is not None:
+                master_table_name = parsed
+                table_name = ''
+                if '(' in master_table_name:
+                    raw_name_parts = master_table_name.split('(')
+                    logical_name = raw_name_parts[0]
+                    table_name = raw_name_parts[1].replace(')', '')
+                else:
+                    logical_name = master_table_name
+                    table_name = 'None'
+                is_table = False
+            if '| --- | --- | --- |' in line:
+                continue
+            if is_table and '|' in line:
+                parts = line.split('|')
+                parts.insert(0, logical_name)
+                parts.insert(1, table_name)
+                rows.append([part.strip() for part in parts if part != ''])
+            if parse_table_header(line):
+                is_table = True
+    return rows
+
+def markdown_to_lines(file: str) -> [str]:
+    return [','.join(row) for row in markdown_to_rows(file)]
+
+def collect_markdown_files(patterns: List[str]) -> List[str]:
+    """ Expand directories (recursively) and glob patterns into a sorted list of markdown files """
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.update(glob.glob(os.path.join(pattern, '**', '*.md'), recursive=True))
+        else:
+            files.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(files)
+
+def _load_state(state_file: Optional[str]) -> dict:
+    if not state_file or not os.path.exists(state_file):
+        return {}
+    with open(state_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_state(state_file: str, state: dict) -> None:
+    with atomic_write(state_file) as f:
+        json.dump(state, f, ensure_ascii=False)
+
+def markdown_files_to_csv(files: List[str], output_file: str, workers: Optional[int] = None,
+                          state_file: Optional[str] = None) -> int:
+    """
+    Parse markdown files in a process pool and write all rows to one CSV with a source file column.
+
+    With state_file, files whose mtime and size (or, failing that, content hash) are unchanged
+    since the last run are not re-parsed; their rows are taken from the state file.
+    Returns the number of files that were parsed.
+    """
+    previous = _load_state(state_file)
+    state = {}
+    to_parse = []
+    for file in files:
+        stat = os.stat(file)
+        entry = previous.get(file)
+        if entry is not None and (entry['mtime_ns'], entry['size']) != (stat.st_mtime_ns, stat.st_size):
+            digest = file_digest(file)
+            entry = dict(entry, mtime_ns=stat.st_mtime_ns, size=stat.st_size) if entry['sha256'] == digest else None
+        if entry is None:
+            to_parse.append(file)
+        else:
+            state[file] = entry
+
+    if to_parse:
+        # multiprocessing の読み込みは重いので、解析するファイルがあるときだけ import する
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for file, rows in zip(to_parse, executor.map(markdown_to_rows, to_parse, chunksize=8)):
+                stat = os.stat(file)
+                state[file] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                               'sha256': file_digest(file) if state_file else '', 'rows': rows}
+
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        for file in files:
+            writer.writerows([file, *row] for row in state[file]['rows'])
+
+    if state_file:
+        _save_state(state_file, state)
+    return len(to_parse)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate columns from mermaid')
+    parser.add_argument('--input_file', '-i', type=str, nargs='+', help='input file path, or directories / glob patterns of markdown files')
+    parser.add_argument('--output_file', '-o', type=str, help='output file path')
+    parser.add_argument('--workers', '-j', type=int, default=None, help='number of parser processes (multi-file mode)')
+    parser.add_argument('--state_file', type=str, help='re-parse only files changed since the run that wrote this state file (multi-file mode)')
+    args = parser.parse_args(argv)
+
+    if len(args.input_file) == 1 and os.path.isfile(args.input_file[0]) and not args.state_file:
+        output_lines = markdown_to_lines(args.input_file[0])
+
+        with open(args.output_file, 'w') as f:
+            f.write('\n'.join(output_lines))
+        return
+
+    files = collect_markdown_files(args.input_file)
+    parsed = markdown_files_to_csv(files, args.output_file, workers=args.workers, state_file=args.state_file)
+    print(f'{len(files)} files, {parsed} parsed')
 
+if __name__ == '__main__':
+    main()
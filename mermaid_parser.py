@@ -0,0 +1,171 @@
+import hashlib
+import os
+import pickle
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, NamedTuple, Optional
+
+from fileutil import atomic_write, prune_cache
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tools", "mermaid")
+# パーサや Table / Column の定義を変えたら上げる（古いキャッシュを読まないようにキーに含める）
+CACHE_VERSION = 2
+# キャッシュに残す解析結果の数。超えたら最後に使われたのが古いものから消す
+CACHE_MAX_ENTRIES = 256
+
+# "論理名(物理名)" { / name { / name["論理名"] {
+TABLE_PATTERN = re.compile(r'[^"]*"(?P<logical_name>[^(]+)\s*\((?P<physical_name>[^)]+)\)" {')
+ENTITY_PATTERN = re.compile(r'^(?:"(?P<quoted>[^"]*)"|(?P<name>[\w-]+)(?:\["(?P<alias>[^"]*)"\])?)\s*\{\s*$')
+# "A(a)" ||--o{ "B(b)" : label
+RELATIONSHIP_PATTERN = re.compile(
+    r'^(?P<left>"[^"]*"|[\w-]+)\s*(?P<cardinality>[|}][|o](?:--|\.\.)[|o][|{])\s*(?P<right>"[^"]*"|[\w-]+)'
+    r'\s*:\s*(?P<label>.*)$')
+# type name [PK, FK] ["comment"]
+COLUMN_PATTERN = re.compile(
+    r'^(?P<data_type>\S+)\s+(?P<physical_name>\S+)(?P<keys>(?:\s+(?:PK|FK|UK)\s*,?)*)'
+    r'(?:\s+(?:"(?P<comment>[^"]*)"|(?P<bare_comment>\S+)))?\s*$')
+KEY_PATTERN = re.compile(r'PK|FK|UK')
+
+
+class Column(NamedTuple):
+    table_name: str
+    physical_name: str
+    logical_name: str
+    data_type: str
+    is_required: bool = False
+    constraint: str = "None"
+
+
+@dataclass
+class Table:
+    physical_name: str
+    logical_name: Optional[str] = None
+    columns: List[Column] = field(default_factory=list)
+
+
+class Relationship(NamedTuple):
+    left: str
+    cardinality: str
+    right: str
+    label: str
+
+
+@dataclass
+class ErDiagram:
+    tables: List[Table] = field(default_factory=list)
+    relationships: List[Relationship] = field(default_factory=list)
+
+
+def parse_text(target_string: str) -> None or (str, str):
+    result = TABLE_PATTERN.search(target_string)
+    if result is None:
+        return None
+    return (result.group('physical_name'), result.group('logical_name'))
+
+
+def _entity_name(token: str) -> str:
+    """Physical table name of a relationship endpoint ("論理名(物理名)" or bare name)."""
+    token = token.strip('"')
+    if token.endswith(')') and '(' in token:
+        return token[token.rindex('(') + 1:-1]
+    return token
+
+
+def _parse_column(table: Table, line: str) -> Optional[Column]:
+    match = COLUMN_PATTERN.match(line)
+    if match is None:
+        return None
+    data_type, physical_name = match.group('data_type'), match.group('physical_name')
+    if physical_name == "id":
+        return Column(table.physical_name, physical_name, "ID", data_type, False, "PK")
+    keys = KEY_PATTERN.findall(match.group('keys'))
+    logical_name = match.group('comment')
+    if logical_name is None:
+        logical_name = match.group('bare_comment')
+    if logical_name is None:
+        if not keys:
+            return None
+        logical_name = ""
+    is_required = "*" in logical_name
+    return Column(table.physical_name, physical_name, logical_name.replace("*", ""), data_type,
+                  is_required, "/".join(keys) if keys else "None")
+
+
+def parse_lines(lines) -> ErDiagram:
+    """Parse Mermaid ER diagram lines into tables, columns and relationships in a single pass."""
+    diagram = ErDiagram()
+    table = None
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("%%"):
+            continue
+        if table is not None:
+            if line.startswith("}"):
+                table = None
+            else:
+                column = _parse_column(table, line)
+                if column is not None:
+                    table.columns.append(column)
+            continue
+        match = RELATIONSHIP_PATTERN.match(line)
+        if match is not None:
+            diagram.relationships.append(Relationship(
+                _entity_name(match.group('left')), match.group('cardinality'),
+                _entity_name(match.group('right')), match.group('label').strip().strip('"')))
+            continue
+        if not line.endswith("{"):
+            continue
+        match = TABLE_PATTERN.search(line)
+        if match is not None:
+            table = Table(match.group('physical_name'), match.group('logical_name'))
+        else:
+            match = ENTITY_PATTERN.match(line)
+            if match is None:
+                continue
+            if match.group('quoted') is not None:
+                table = Table(match.group('quoted'))
+            else:
+                table = Table(match.group('name'), match.group('alias'))
+        diagram.tables.append(table)
+    return diagram
+
+
+def parse_file(file: str, cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+               max_entries: int = CACHE_MAX_ENTRIES) -> ErDiagram:
+    """
+    Parse a Mermaid file, reusing the cached result for identical file contents.
+
+    The cache key includes CACHE_VERSION, and at most max_entries results are kept
+    (a hit refreshes the entry's mtime, so the least recently used ones are removed first).
+    """
+    with open(file, 'rb') as f:
+        data = f.read()
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"v{CACHE_VERSION}-{hashlib.sha256(data).hexdigest()}.pickle")
+        try:
+            with open(cache_path, 'rb') as f:
+                diagram = pickle.load(f)
+            os.utime(cache_path)
+            return diagram
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            pass
+    diagram = parse_lines(data.decode('utf-8').splitlines())
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        with atomic_write(cache_path, 'wb') as f:
+            pickle.dump(diagram, f, protocol=pickle.HIGHEST_PROTOCOL)
+        prune_cache(cache_dir, max_entries, '.pickle')
+    return diagram
+
+
+def column_rows(diagram: ErDiagram) -> List[str]:
+    return [
+        f"{column.table_name},{column.physical_name},{column.logical_name},"
+        f"{column.data_type},{column.is_required},{column.constraint}".strip()
+        for table in diagram.tables for column in table.columns
+    ]
+
+
+def table_names(diagram: ErDiagram) -> Dict[str, str]:
+    return {table.physical_name: table.logical_name for table in diagram.tables if table.logical_name is not None}
@@ -0,0 +1,260 @@
+import atexit
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import List, Optional
+
+from fileutil import atomic_write
+
+# 計測は --metrics を指定したときだけ有効になる。無効なときの stage() / api_call() は
+# 何もしないコンテキストマネージャを返すだけなので、呼び出し側のコストはほぼゼロ
+_recorder = None
+_NULL_STAGE = contextlib.nullcontext()
+
+# 段階ごとのピーク RSS は Linux で /proc/self/clear_refs に 5 を書いて VmHWM をリセットして測る。
+# リセットはプロセス全体に効くので、実行中の段階がないときだけ行う（段階が重なっていれば、
+# 後から始まった段階の値はその段階より前から続く区間のピークになる）
+_stage_lock = threading.Lock()
+_active_stages = 0
+_can_reset_peak = sys.platform.startswith("linux")
+
+
+def _reset_peak_rss() -> None:
+    global _can_reset_peak
+    if _can_reset_peak:
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            _can_reset_peak = False
+
+
+def _stage_peak_rss_bytes() -> Optional[int]:
+    """ 最後のリセットからのピーク RSS（リセットできない環境では None） """
+    if not _can_reset_peak:
+        return None
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class _Recorder:
+    """ イベントを JSON Lines に逐次追記するか、メモリに溜めて終了時に Prometheus textfile に書き出す """
+
+    def __init__(self, path: Optional[str], format: str):
+        self.path = path
+        self.format = format
+        self.events: List[dict] = []
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if path and format == "jsonl" else None
+
+    def emit(self, event: dict) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+                self._file.flush()
+            else:
+                self.events.append(event)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            elif self.path and self.format == "prometheus":
+                with atomic_write(self.path) as f:
+                    f.write(to_prometheus(self.events))
+
+
+def enable(path: str, format: Optional[str] = None) -> None:
+    """
+    計測を有効にする。format を省略した場合、拡張子が .prom なら Prometheus textfile、
+    それ以外は JSON Lines として path に書き出す。
+    """
+    global _recorder
+    close()
+    format = format or ("prometheus" if path.endswith(".prom") else "jsonl")
+    if format not in ("jsonl", "prometheus"):
+        raise ValueError(f"Unknown metrics format: {format}")
+    _recorder = _Recorder(path, format)
+    atexit.register(close)
+
+
+def enable_collecting() -> None:
+    """ ファイルに書かずにイベントをメモリに溜める（子プロセスで collect() と組み合わせて使う） """
+    global _recorder
+    _recorder = _Recorder(None, "memory")
+
+
+def is_enabled() -> bool:
+    return _recorder is not None
+
+
+def close() -> None:
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
+
+
+def collect() -> List[dict]:
+    """ メモリに溜めたイベントを取り出して空にする """
+    if _recorder is None:
+        return []
+    with _recorder._lock:
+        events, _recorder.events = _recorder.events, []
+    return events
+
+
+def merge(events: List[dict]) -> None:
+    """ 子プロセスで collect() したイベントを現在の出力先に流す """
+    if _recorder is not None:
+        for event in events:
+            _recorder.emit(event)
+
+
+def run_collected(function, *args, **kwargs):
+    """
+    ProcessPoolExecutor に渡すためのラッパー。子プロセスで計測を有効にして function を実行し、
+    (戻り値, イベント) を返す。
+    """
+    enable_collecting()
+    try:
+        return function(*args, **kwargs), collect()
+    finally:
+        close()
+
+
+class _Stage:
+    __slots__ = ("name", "labels", "wall", "cpu")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        global _active_stages
+        with _stage_lock:
+            if _active_stages == 0:
+                _reset_peak_rss()
+            _active_stages += 1
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active_stages
+        wall_seconds = time.perf_counter() - self.wall
+        cpu_seconds = time.process_time() - self.cpu
+        with _stage_lock:
+            peak_rss_bytes = _stage_peak_rss_bytes()
+            _active_stages -= 1
+        recorder = _recorder
+        if recorder is not None:
+            recorder.emit({
+                "type": "stage", "stage": self.name, "ts": time.time(), "pid": os.getpid(),
+                "wall_seconds": wall_seconds,
+                # プロセス全体の CPU 時間（スレッドで並行する処理の分も含む）
+                "cpu_seconds": cpu_seconds,
+                "peak_rss_bytes": peak_rss_bytes,
+                "status": "ok" if exc_type is None else "error",
+                **self.labels,
+            })
+        return False
+
+
+def stage(name: str, **labels):
+    """
+    処理段階の実時間・CPU 時間・ピーク RSS を記録するコンテキストマネージャ。
+    peak_rss_bytes はその段階の間のピーク（VmHWM をリセットできる Linux のみ。ほかでは None）。
+    """
+    if _recorder is None:
+        return _NULL_STAGE
+    return _Stage(name, labels)
+
+
+_API_CALL_FIELDS = {"bytes_sent": 0, "tokens_in": 0, "tokens_out": 0, "retries": 0}
+
+
+class _ApiCall(dict):
+    """ with ブロック内で bytes_sent / tokens_in / tokens_out / retries を設定できる辞書 """
+
+    def __init__(self, api, labels):
+        super().__init__(_API_CALL_FIELDS)
+        self.api = api
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        recorder = _recorder
+        if recorder is not None:
+            recorder.emit({
+                "type": "api_call", "api": self.api, "ts": time.time(), "pid": os.getpid(),
+                "latency_seconds": time.perf_counter() - self.start,
+                "status": "ok" if exc_type is None else "error",
+                **self, **self.labels,
+            })
+        return False
+
+
+def api_call(api: str, **labels):
+    """
+    API 呼び出し 1 回分のレイテンシと、with ブロック内で設定された送信バイト数・トークン数・
+    リトライ回数を記録する。無効なときも同じキーを持つ（記録されない）辞書を返すので、
+    呼び出し側は call["bytes_sent"] += n のように有効・無効を区別せずに書ける。
+    """
+    if _recorder is None:
+        return contextlib.nullcontext(dict(_API_CALL_FIELDS))
+    return _ApiCall(api, labels)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(events: List[dict]) -> str:
+    """ イベントを段階名・API 名ごとに集計した Prometheus textfile 形式の文字列を返す """
+    metrics = {}
+
+    def add(name, kind, help, labels, value, aggregate=sum):
+        samples = metrics.setdefault(name, (kind, help, {}))[2]
+        key = tuple(sorted(labels.items()))
+        samples[key] = aggregate((samples[key], value)) if key in samples else value
+
+    for event in events:
+        if event["type"] == "stage":
+            labels = {"stage": event["stage"]}
+            add("tools_stage_runs_total", "counter", "Completed runs of a stage", dict(labels, status=event["status"]), 1)
+            add("tools_stage_wall_seconds_total", "counter", "Wall time spent in a stage", labels, event["wall_seconds"])
+            add("tools_stage_cpu_seconds_total", "counter", "Process CPU time spent in a stage", labels, event["cpu_seconds"])
+            if event.get("peak_rss_bytes") is not None:
+                add("tools_stage_peak_rss_bytes", "gauge", "Highest peak RSS while a stage ran",
+                    labels, event["peak_rss_bytes"], max)
+        elif event["type"] == "api_call":
+            labels = {"api": event["api"]}
+            add("tools_api_calls_total", "counter", "API calls", dict(labels, status=event["status"]), 1)
+            add("tools_api_latency_seconds_total", "counter", "Total API call latency", labels, event["latency_seconds"])
+            add("tools_api_latency_seconds_max", "gauge", "Slowest API call", labels, event["latency_seconds"], max)
+            add("tools_api_bytes_sent_total", "counter", "Bytes uploaded to the API", labels, event["bytes_sent"])
+            add("tools_api_tokens_total", "counter", "Tokens consumed", dict(labels, direction="in"), event["tokens_in"])
+            add("tools_api_tokens_total", "counter", "Tokens consumed", dict(labels, direction="out"), event["tokens_out"])
+            add("tools_api_retries_total", "counter", "Retries of API calls", labels, event["retries"])
+
+    lines = []
+    for name, (kind, help, samples) in metrics.items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        for key, value in samples.items():
+            labels = ",".join(f'{label}="{_escape(v)}"' for label, v in key)
+            lines.append(f"{name}{{{labels}}} {value}")
+    return "\n".join(lines) + "\n"
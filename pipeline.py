@@ -0,0 +1,336 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from fileutil import atomic_write
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tools", "pipeline")
+FORMATTERS = ("format", "process", "none")
+# Chunks are uploaded to Whisper as MP3 at this bitrate (about 8 KB per second of audio)
+UPLOAD_BITRATE_KBPS = 64
+_DONE = object()
+
+
+class ArtifactCache:
+    """
+    Content-addressed store for intermediate pipeline artifacts.
+
+    Each stage keeps its outputs under `<cache_dir>/<stage>/<key>`, where the key is a hash
+    of the stage input and the parameters that affect the output, so a rerun recomputes only
+    the chunks whose input (or settings) changed.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def key(data: bytes, **params) -> str:
+        digest = hashlib.sha256(data)
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, stage: str, key: str) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.cache_dir, stage, key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, stage: str, key: str, data: bytes) -> None:
+        directory = os.path.join(self.cache_dir, stage)
+        os.makedirs(directory, exist_ok=True)
+        with atomic_write(os.path.join(directory, key), 'wb') as f:
+            f.write(data)
+
+
+def speech_aligned_chunks(blocks: Iterator[np.ndarray], sr: int, min_keep: float = 0.5) -> Iterator[np.ndarray]:
+    """
+    Re-cut decoded blocks so chunk boundaries fall in pauses rather than mid-word.
+
+    If speech runs into the end of a block, the chunk is cut where that last speech segment
+    starts (as long as at least min_keep of the block remains) and the tail is carried over
+    into the next chunk.
+    """
+    import convert
+
+    frame_size = int(sr * 0.03)
+    carry = np.empty(0, dtype=np.float32)
+    for block in blocks:
+        chunk = np.concatenate((carry, block))
+        cut = len(chunk)
+        segments = convert.vad_segments(chunk, sr)
+        if len(segments) and segments[-1, 1] >= len(chunk) - frame_size and segments[-1, 0] > min_keep * len(chunk):
+            cut = int(segments[-1, 0])
+        yield chunk[:cut]
+        carry = chunk[cut:]
+    if len(carry):
+        yield carry
+
+
+def max_chunk_seconds(bitrate_kbps: int = UPLOAD_BITRATE_KBPS) -> float:
+    """
+    Longest chunk_seconds whose chunks still fit Whisper's upload limit. speech_aligned_chunks
+    carries the tail of each chunk into the next, so a chunk can approach twice chunk_seconds.
+    """
+    import transcribe_audio
+
+    return transcribe_audio.WHISPER_MAX_BYTES / (bitrate_kbps * 1000 / 8) / 2
+
+
+def _encode_upload(data: bytes) -> io.BytesIO:
+    """Encode a preprocessed WAV chunk as MP3 for upload; WAV takes 32 KB per second at 16 kHz."""
+    from pydub import AudioSegment
+
+    buffer = io.BytesIO()
+    AudioSegment.from_wav(io.BytesIO(data)).export(buffer, format="mp3", bitrate=f"{UPLOAD_BITRATE_KBPS}k")
+    buffer.seek(0)
+    return buffer
+
+
+def _run_stage(name: str, function: Callable, inbox: queue.Queue, outbox: queue.Queue, workers: int,
+               errors: List[BaseException], stop: threading.Event) -> List[threading.Thread]:
+    """
+    Start `workers` threads that apply function to (index, value) items from inbox and put
+    (index, result) on outbox. When inbox is exhausted, a single _DONE is forwarded.
+    After a failure anywhere in the pipeline, remaining items are drained without work.
+    """
+    def worker():
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                inbox.put(_DONE)  # let sibling workers see it too
+                return
+            if stop.is_set():
+                continue
+            index, value = item
+            try:
+                with metrics.stage(name, chunk=index):
+                    result = function(index, value)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+                continue
+            outbox.put((index, result))
+
+    threads = [threading.Thread(target=worker, name=f"{name}-{i}", daemon=True) for i in range(max(1, workers))]
+
+    def closer():
+        for thread in threads:
+            thread.join()
+        outbox.put(_DONE)
+
+    for thread in threads:
+        thread.start()
+    threading.Thread(target=closer, name=f"{name}-closer", daemon=True).start()
+    return threads
+
+
+def run_pipeline(input_file: str, output_file: str, client, transcript_file: Optional[str] = None,
+                 chunk_seconds: float = 300, queue_size: int = 2, preprocess_workers: int = 1,
+                 transcribe_workers: int = 4, format_workers: int = 4, formatter: str = "format",
+                 model: str = "gpt-4o-mini", cache_dir: Optional[str] = DEFAULT_CACHE_DIR,
+                 noise_profile: Optional[str] = None, sr: int = 16000) -> Tuple[int, int]:
+    """
+    Preprocess, transcribe and format an audio file chunk by chunk, with the stages overlapped.
+
+    Stages are connected by bounded queues (queue_size items each), so chunk N is being
+    transcribed while chunk N+1 is preprocessed and chunk N-1 is formatted, and decoded audio
+    never piles up ahead of a slow stage. Results are written to output_file (and the raw
+    transcript to transcript_file) in chunk order as soon as each prefix of chunks is done.
+    With cache_dir, each stage's artifact is cached by a hash of its input, so a rerun only
+    recomputes what changed.
+
+    Args:
+        input_file (str): Path to the audio file
+        output_file (str): Path to write the formatted text to
+        client (OpenAI): OpenAI client used for transcription and formatting
+        transcript_file (str, optional): Path to also write the unformatted transcript to
+        chunk_seconds (float): Target chunk length; chunks are cut in pauses near this length.
+            At most max_chunk_seconds(), since chunks are uploaded as 64 kbps MP3
+        queue_size (int): Maximum number of chunks waiting between two stages
+        preprocess_workers (int): Threads for noise reduction / band-pass / VAD
+        transcribe_workers (int): Concurrent Whisper uploads
+        format_workers (int): Concurrent formatting requests
+        formatter (str): "format" (format_transcription), "process" (process_transcript) or "none"
+        model (str): Chat model used by the "format" formatter
+        cache_dir (str, optional): Artifact cache directory; None disables caching
+        noise_profile (str, optional): Device/room ID of a cached noise profile (see convert.py)
+        sr (int): Sample rate audio is decoded to
+
+    Returns:
+        Tuple[int, int]: Number of chunks, and number of chunks whose stages were all served from the cache
+    """
+    import convert
+    import transcribe_audio
+
+    if chunk_seconds > max_chunk_seconds():
+        raise ValueError(f"chunk_seconds must be at most {max_chunk_seconds():.0f} so that chunks fit "
+                         f"Whisper's {transcribe_audio.WHISPER_MAX_BYTES // (1024 * 1024)} MB upload limit")
+    cache = ArtifactCache(cache_dir) if cache_dir else None
+    transcripts = transcribe_audio.TranscriptionCache(os.path.join(cache_dir, "transcripts")) if cache_dir else None
+    profile_cache = convert.NoiseProfileCache() if noise_profile else None
+    profile = [None]
+    hits = {"preprocess": set(), "transcribe": set(), "format": set()}
+
+    def preprocess(index, audio):
+        key = cache.key(audio.tobytes(), sr=sr, noise_profile=noise_profile) if cache else None
+        data = cache.get("preprocess", key) if cache else None
+        if data is not None:
+            hits["preprocess"].add(index)
+            return data
+        if noise_profile and profile[0] is None:
+            profile[0] = profile_cache.get_or_estimate(noise_profile, audio, sr)
+        audio = convert.noise_reduction(audio, sr, profile[0])
+        audio = convert.bandpass_filter(audio, sr)
+        audio = convert.vad_filter(audio, sr)
+        buffer = io.BytesIO()
+        if len(audio):
+            convert.save_audio_stream(buffer, [audio], sr)
+        data = buffer.getvalue()
+        if cache:
+            cache.put("preprocess", key, data)
+        return data
+
+    def transcribe(index, data):
+        if not data:
+            hits["transcribe"].add(index)
+            return ""
+        key = transcripts.key(data) if transcripts else None
+        text = transcripts.get(key) if transcripts else None
+        if text is not None:
+            hits["transcribe"].add(index)
+            return text
+        text = transcribe_audio.transcribe_chunk(client, (f"chunk_{index}.mp3", _encode_upload(data)))
+        if transcripts:
+            transcripts.put(key, text)
+        return text
+
+    def format_chunk(index, text):
+        if formatter == "none" or not text.strip():
+            hits["format"].add(index)
+            return text, text
+        key = cache.key(text.encode("utf-8"), formatter=formatter, model=model) if cache else None
+        data = cache.get("format", key) if cache else None
+        if data is not None:
+            hits["format"].add(index)
+            return text, data.decode("utf-8")
+        if formatter == "process":
+            import process_transcript
+
+            formatted = process_transcript.process_chunk(client, text)
+        else:
+            import format_transcription
+
+            try:
+                formatted = format_transcription.format_segment(client, text, model=model)
+            except Exception:
+                formatted = None
+        if not formatted:
+            print(f"Warning: formatting chunk {index + 1} failed, using the transcript as is")
+            return text, text
+        if cache:
+            cache.put("format", key, formatted.encode("utf-8"))
+        return text, formatted
+
+    errors: List[BaseException] = []
+    stop = threading.Event()
+    decoded, preprocessed, transcribed, formatted = (queue.Queue(maxsize=max(1, queue_size)) for _ in range(4))
+    _run_stage("pipeline.preprocess", preprocess, decoded, preprocessed, preprocess_workers, errors, stop)
+    _run_stage("pipeline.transcribe", transcribe, preprocessed, transcribed, transcribe_workers, errors, stop)
+    _run_stage("pipeline.format", format_chunk, transcribed, formatted, format_workers, errors, stop)
+
+    def produce():
+        try:
+            block_size = int(sr * chunk_seconds)
+            for index, chunk in enumerate(speech_aligned_chunks(convert.stream_audio(input_file, sr, block_size), sr)):
+                if stop.is_set():
+                    break
+                decoded.put((index, chunk))
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            decoded.put(_DONE)
+
+    threading.Thread(target=produce, name="pipeline.decode", daemon=True).start()
+
+    # Write each chunk as soon as every chunk before it is done
+    pending = {}
+    next_index = 0
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(open(output_file, 'w', encoding='utf-8'))
+        raw = stack.enter_context(open(transcript_file, 'w', encoding='utf-8')) if transcript_file else None
+        while True:
+            item = formatted.get()
+            if item is _DONE:
+                break
+            pending[item[0]] = item[1]
+            while next_index in pending:
+                text, formatted_text = pending.pop(next_index)
+                if next_index:
+                    out.write("\n\n")
+                out.write(formatted_text)
+                out.flush()
+                if raw:
+                    raw.write(text + "\n")
+                    raw.flush()
+                print(f"Chunk {next_index + 1} done")
+                next_index += 1
+    if errors:
+        raise errors[0]
+    cached = len(set(range(next_index)).intersection(*hits.values()))
+    return next_index, cached
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Preprocess, transcribe and format an audio file in one pipelined run')
+    parser.add_argument('input_file', help='Path to the audio file')
+    parser.add_argument('-o', '--output', required=True, help='Path to save the formatted text')
+    parser.add_argument('--transcript', help='Path to also save the unformatted transcript (optional)')
+    parser.add_argument('--api-key', help='OpenAI API key (optional if OPENAI_API_KEY env variable is set)')
+    parser.add_argument('--formatter', choices=FORMATTERS, default='format',
+                        help='format: format_transcription, process: process_transcript, none: transcript only (default: format)')
+    parser.add_argument('--model', default='gpt-4o-mini', help='Chat model for the format formatter (default: gpt-4o-mini)')
+    parser.add_argument('--chunk-seconds', type=float, default=300, help='Target chunk length in seconds (default: 300; at most about 1600 so chunks fit the 25 MB upload limit)')
+    parser.add_argument('--queue-size', type=int, default=2, help='Chunks allowed to wait between stages (default: 2)')
+    parser.add_argument('--preprocess-workers', type=int, default=1, help='Preprocessing threads (default: 1)')
+    parser.add_argument('--transcribe-workers', type=int, default=4, help='Concurrent transcription uploads (default: 4)')
+    parser.add_argument('--format-workers', type=int, default=4, help='Concurrent formatting requests (default: 4)')
+    parser.add_argument('--noise-profile', help='Device/room ID of a cached noise profile (see convert.py --noise_profile)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'Artifact cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the artifact cache')
+    parser.add_argument('--metrics', help='Write per-stage and per-API-call metrics to this file (.prom for a Prometheus textfile, JSON lines otherwise)')
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    api_key = args.api_key or os.getenv('OPENAI_API_KEY')
+    if not api_key:
+        parser.error("OpenAI API key not found. Please provide --api-key or set OPENAI_API_KEY environment variable")
+
+    from openai import OpenAI
+
+    try:
+        chunks, cached = run_pipeline(
+            args.input_file, args.output, OpenAI(api_key=api_key), transcript_file=args.transcript,
+            chunk_seconds=args.chunk_seconds, queue_size=args.queue_size,
+            preprocess_workers=args.preprocess_workers, transcribe_workers=args.transcribe_workers,
+            format_workers=args.format_workers, formatter=args.formatter, model=args.model,
+            cache_dir=None if args.no_cache else args.cache_dir, noise_profile=args.noise_profile)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        exit(1)
+    print(f"Pipeline completed: {chunks} chunks ({cached} fully cached). Output written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
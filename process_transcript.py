@@ -1,8 +1,9 @@
 import argparse
 import os
+import re
 import time
 
-from openai import OpenAI
+import metrics
 
 
 def split_text_by_conversation(text, max_chars=10000):
@@ -33,29 +34,132 @@ def split_text_by_conversation(text, max_chars=10000):
 
     return chunks
 
-def process_chunk(client, chunk):
+def parse_reset_duration(value):
+    """Parse a rate-limit reset duration such as '1s', '6m0s' or '20ms' into seconds."""
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(amount) * units[unit] for amount, unit in re.findall(r'(\d+(?:\.\d+)?)(ms|s|m|h)', value or ''))
+
+def estimate_request_tokens(chunk):
+    """
+    Rough token need of one request for chunk: prompt plus a completion of about the same length.
+
+    Japanese transcripts run close to one token per character with the gpt-4o tokenizers, so the
+    character count is used as the token count (an overestimate for ASCII text).
+    """
+    return 2 * (len(chunk) + 100)
+
+class AdaptiveRateLimiter:
+    """
+    Wait between requests only when the rate-limit response headers say the budget is exhausted.
+
+    Requests go out back to back while x-ratelimit-remaining-requests has room and
+    x-ratelimit-remaining-tokens covers the next request's token need; otherwise the next
+    request waits for the matching x-ratelimit-reset-* duration.
+    """
+
+    def __init__(self):
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+
+    def update(self, headers):
+        """Record the rate-limit state reported by a response."""
+        now = time.monotonic()
+        remaining_requests = headers.get('x-ratelimit-remaining-requests')
+        remaining_tokens = headers.get('x-ratelimit-remaining-tokens')
+        if remaining_requests is not None:
+            self.remaining_requests = int(remaining_requests)
+            self.requests_reset_at = now + parse_reset_duration(headers.get('x-ratelimit-reset-requests'))
+        if remaining_tokens is not None:
+            self.remaining_tokens = int(remaining_tokens)
+            self.tokens_reset_at = now + parse_reset_duration(headers.get('x-ratelimit-reset-tokens'))
+
+    def wait(self, tokens_needed=0):
+        """Sleep until the rate limit has room for a request needing tokens_needed tokens, if needed."""
+        resume_at = 0.0
+        if self.remaining_requests is not None and self.remaining_requests <= 0:
+            resume_at = self.requests_reset_at
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens_needed:
+            resume_at = max(resume_at, self.tokens_reset_at)
+        delay = resume_at - time.monotonic()
+        if delay > 0:
+            print(f"Rate limit reached, waiting {delay:.1f}s...")
+            time.sleep(delay)
+            # The budget is back to its full size after the reset
+            self.remaining_requests = self.remaining_tokens = None
+
+def _create_completion(client, chunk, stream=False):
+    return client.chat.completions.with_raw_response.create(
+        model="gpt-4o-mini",  # 4k-mini model
+        messages=[
+            {"role": "system", "content": "自然な文章に修正してください。ただし、会議の文字起こしなので極力元の会話を再現してください。"},
+            {"role": "user", "content": chunk}
+        ],
+        temperature=0.7,
+        stream=stream,
+        # ストリーミングでも最後のイベントでトークン使用量を受け取る
+        **({"stream_options": {"include_usage": True}} if stream else {})
+    )
+
+def _record_usage(call, usage):
+    if usage is not None:
+        call["tokens_in"] = usage.prompt_tokens
+        call["tokens_out"] = usage.completion_tokens
+
+def process_chunk(client, chunk, limiter=None):
     """Process a single chunk of text using OpenAI API."""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # 4k-mini model
-            messages=[
-                {"role": "system", "content": "自然な文章に修正してください。ただし、会議の文字起こしなので極力元の会話を再現してください。"},
-                {"role": "user", "content": chunk}
-            ],
-            temperature=0.7
-        )
+        if limiter:
+            limiter.wait(estimate_request_tokens(chunk))
+        with metrics.api_call("openai.chat.completions", model="gpt-4o-mini") as call:
+            raw_response = _create_completion(client, chunk)
+            if limiter:
+                limiter.update(raw_response.headers)
+            response = raw_response.parse()
+            _record_usage(call, response.usage)
         return response.choices[0].message.content
     except Exception as e:
         print(f"Error processing chunk: {e}")
         return None
 
-def main():
+def process_chunk_stream(client, chunk, output, limiter=None):
+    """Process a single chunk with a streamed completion, appending tokens to output as they arrive."""
+    try:
+        if limiter:
+            limiter.wait(estimate_request_tokens(chunk))
+        with metrics.api_call("openai.chat.completions", model="gpt-4o-mini", stream=True) as call:
+            raw_response = _create_completion(client, chunk, stream=True)
+            if limiter:
+                limiter.update(raw_response.headers)
+            wrote = False
+            for event in raw_response.parse():
+                if event.choices and event.choices[0].delta.content:
+                    output.write(event.choices[0].delta.content)
+                    output.flush()
+                    wrote = True
+                _record_usage(call, getattr(event, "usage", None))
+        return wrote
+    except Exception as e:
+        print(f"Error processing chunk: {e}")
+        return False
+
+def _checkpoint(output):
+    """Flush output and fsync it so completed chunks survive a crash."""
+    output.flush()
+    os.fsync(output.fileno())
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Process transcribed text using OpenAI API')
     parser.add_argument('input_file', help='Path to the input transcription file')
     parser.add_argument('output_file', help='Path to save the processed output')
     parser.add_argument('--api-key', help='OpenAI API key (optional, defaults to environment variable)')
+    parser.add_argument('--stream', action='store_true', help='Stream completions and append each chunk to the output file as it arrives')
+    parser.add_argument('--metrics', help='Write per-API-call metrics to this file (.prom for a Prometheus textfile, JSON lines otherwise)')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable(args.metrics)
 
     # Get API key from argument or environment variable
     api_key = args.api_key or os.getenv('OPENAI_API_KEY')
@@ -63,7 +167,11 @@ def main():
         raise ValueError("OpenAI API key must be provided either through --api-key argument or OPENAI_API_KEY environment variable")
 
     # Initialize OpenAI client
+    from openai import OpenAI
+
     client = OpenAI(api_key=api_key)
+    # Wait between requests only when the rate-limit headers require it
+    limiter = AdaptiveRateLimiter()
 
     try:
         # Read input file
@@ -73,16 +181,29 @@ def main():
         # Split text into chunks
         chunks = split_text_by_conversation(text)
 
+        if args.stream:
+            with open(args.output_file, 'w', encoding='utf-8') as f:
+                for i, chunk in enumerate(chunks):
+                    print(f"Processing chunk {i+1}/{len(chunks)}...")
+                    if i > 0:
+                        f.write('\n')
+                    checkpoint = f.tell()
+                    if not process_chunk_stream(client, chunk, f, limiter):
+                        print(f"Warning: Chunk {i+1} processing failed, using original text")
+                        # Drop any partial output of the failed chunk
+                        f.seek(checkpoint)
+                        f.truncate()
+                        f.write(chunk)
+                    _checkpoint(f)
+            print(f"Processing complete. Output written to {args.output_file}")
+            return
+
         # Process each chunk
         processed_chunks = []
         for i, chunk in enumerate(chunks):
             print(f"Processing chunk {i+1}/{len(chunks)}...")
 
-            # Add delay between requests to respect rate limits
-            if i > 0:
-                time.sleep(1)
-
-            result = process_chunk(client, chunk)
+            result = process_chunk(client, chunk, limiter)
             if result:
                 processed_chunks.append(result)
             else:
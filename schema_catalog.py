@@ -0,0 +1,220 @@
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+from typing import Iterable, List, Optional, Tuple
+
+from fileutil import file_digest
+
+DEFAULT_CATALOG_PATH = "schema_catalog.sqlite3"
+KINDS = ("mermaid", "markdown", "notion")
+EXTENSION_KINDS = {".mmd": "mermaid", ".mermaid": "mermaid", ".md": "markdown", ".csv": "notion"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    sha256 TEXT NOT NULL,
+    ingested_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS tables (
+    source_id INTEGER NOT NULL REFERENCES sources(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    physical_name TEXT,
+    logical_name TEXT
+);
+CREATE TABLE IF NOT EXISTS columns (
+    source_id INTEGER NOT NULL REFERENCES sources(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    table_name TEXT,
+    physical_name TEXT,
+    logical_name TEXT,
+    data_type TEXT,
+    is_required INTEGER,
+    constraint_name TEXT,
+    size TEXT
+);
+CREATE INDEX IF NOT EXISTS tables_physical ON tables (physical_name, logical_name, kind);
+CREATE INDEX IF NOT EXISTS tables_logical ON tables (logical_name, kind);
+CREATE INDEX IF NOT EXISTS tables_source ON tables (source_id);
+CREATE INDEX IF NOT EXISTS columns_physical ON columns (table_name, physical_name, logical_name, kind);
+CREATE INDEX IF NOT EXISTS columns_physical_name ON columns (physical_name, kind);
+CREATE INDEX IF NOT EXISTS columns_logical ON columns (logical_name, kind);
+CREATE INDEX IF NOT EXISTS columns_source ON columns (source_id);
+"""
+
+
+def _read_mermaid(file: str) -> Tuple[List[tuple], List[tuple]]:
+    from mermaid_parser import parse_file
+
+    diagram = parse_file(file)
+    tables = [(table.physical_name, table.logical_name) for table in diagram.tables]
+    columns = [
+        (column.table_name, column.physical_name, column.logical_name, column.data_type,
+         int(column.is_required), column.constraint, None)
+        for table in diagram.tables for column in table.columns
+    ]
+    return tables, columns
+
+
+def _read_markdown(file: str) -> Tuple[List[tuple], List[tuple]]:
+    from markdown_to_csv import markdown_to_rows
+
+    # マスターデータの Markdown からはテーブル名（論理名・物理名）だけを取り込む。
+    # 物理名のない見出しは markdown_to_rows が 'None' で埋めるので NULL に戻す
+    tables = dict.fromkeys((None if row[1] == 'None' else row[1], row[0]) for row in markdown_to_rows(file))
+    return list(tables), []
+
+
+def _read_notion(file: str) -> Tuple[List[tuple], List[tuple]]:
+    from generate_columns_from_notion_database import notion_database_to_fields
+
+    # Notion のエクスポートにはテーブル名・物理名がないため、論理名だけで照合する
+    columns = [
+        (None, None, logical_name, f"{component_type}/{format}" if format else component_type, None, None, size)
+        for logical_name, component_type, format, size in notion_database_to_fields(file)
+    ]
+    return [], columns
+
+
+READERS = {"mermaid": _read_mermaid, "markdown": _read_markdown, "notion": _read_notion}
+
+
+class SchemaCatalog:
+    """
+    SQLite catalog of tables and columns ingested from mermaid ER diagrams, master-data markdown
+    and Notion database exports. Sources are re-ingested only when their content hash changes.
+    """
+
+    def __init__(self, path: str = DEFAULT_CATALOG_PATH):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def ingest(self, file: str, kind: Optional[str] = None) -> bool:
+        """Ingest one file, replacing its previous rows. Returns False if it was unchanged."""
+        kind = kind or EXTENSION_KINDS.get(os.path.splitext(file)[1].lower())
+        if kind not in READERS:
+            raise ValueError(f"Cannot tell the source kind of {file}; pass one of {', '.join(KINDS)}")
+        path = os.path.abspath(file)
+        digest = file_digest(file)
+        row = self.connection.execute("SELECT id, sha256 FROM sources WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[1] == digest:
+            return False
+
+        tables, columns = READERS[kind](file)
+        with self.connection:
+            if row is not None:
+                self.connection.execute("DELETE FROM sources WHERE id = ?", (row[0],))
+            source_id = self.connection.execute(
+                "INSERT INTO sources (kind, path, sha256) VALUES (?, ?, ?)", (kind, path, digest)).lastrowid
+            self.connection.executemany(
+                "INSERT INTO tables VALUES (?, ?, ?, ?)", [(source_id, kind, *table) for table in tables])
+            self.connection.executemany(
+                "INSERT INTO columns VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [(source_id, kind, *column) for column in columns])
+        return True
+
+    def missing_columns(self, source_kind: str, target_kind: str, by: str = "logical") -> List[tuple]:
+        """Columns of source_kind that have no counterpart in target_kind (by logical or physical name)."""
+        if by == "physical":
+            condition = "t.table_name = s.table_name AND t.physical_name = s.physical_name"
+        else:
+            condition = "t.logical_name = s.logical_name"
+        return self.connection.execute(f"""
+            SELECT DISTINCT s.table_name, s.physical_name, s.logical_name
+            FROM columns s
+            WHERE s.kind = ? AND NOT EXISTS (SELECT 1 FROM columns t WHERE t.kind = ? AND {condition})
+            ORDER BY s.table_name, s.physical_name, s.logical_name
+        """, (source_kind, target_kind)).fetchall()
+
+    def logical_name_mismatches(self) -> List[tuple]:
+        """
+        Tables and columns whose physical name appears with at least two distinct logical names across
+        sources. Sources without a logical name (NULL) are not counted as conflicting. Each conflicting
+        (kind, logical name) is returned as its own row.
+        """
+        tables = self.connection.execute("""
+            WITH conflicts AS (
+                SELECT physical_name FROM tables WHERE physical_name IS NOT NULL
+                GROUP BY physical_name
+                HAVING COUNT(DISTINCT logical_name) > 1
+            )
+            SELECT DISTINCT 'table', t.physical_name, NULL, t.kind, t.logical_name
+            FROM conflicts JOIN tables t USING (physical_name)
+            WHERE t.logical_name IS NOT NULL
+            ORDER BY 2, 4, 5
+        """).fetchall()
+        columns = self.connection.execute("""
+            WITH conflicts AS (
+                SELECT table_name, physical_name FROM columns WHERE physical_name IS NOT NULL
+                GROUP BY table_name, physical_name
+                HAVING COUNT(DISTINCT logical_name) > 1
+            )
+            SELECT DISTINCT 'column', c.table_name, c.physical_name, c.kind, c.logical_name
+            FROM conflicts JOIN columns c USING (table_name, physical_name)
+            WHERE c.logical_name IS NOT NULL
+            ORDER BY 2, 3, 4, 5
+        """).fetchall()
+        return tables + columns
+
+    def find(self, name: str) -> List[tuple]:
+        """Tables and columns whose physical or logical name starts with name."""
+        pattern = name.replace('[', '[[]').replace('*', '[*]').replace('?', '[?]') + '*'
+        return self.connection.execute("""
+            SELECT 'table', kind, physical_name, NULL, logical_name FROM tables
+            WHERE physical_name GLOB :p OR logical_name GLOB :p
+            UNION
+            SELECT 'column', kind, table_name, physical_name, logical_name FROM columns
+            WHERE physical_name GLOB :p OR logical_name GLOB :p
+            ORDER BY 1, 3, 4
+        """, {"p": pattern}).fetchall()
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def _write_rows(rows: Iterable[tuple]) -> None:
+    writer = csv.writer(sys.stdout)
+    writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cross-check schemas from mermaid, markdown and Notion exports')
+    parser.add_argument('--catalog', '-c', type=str, default=DEFAULT_CATALOG_PATH, help='catalog file path')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest = subparsers.add_parser('ingest', help='ingest files (unchanged files are skipped)')
+    ingest.add_argument('files', nargs='+', help='mermaid (.mmd), markdown (.md) or Notion export (.csv) files')
+    ingest.add_argument('--kind', '-k', choices=KINDS, help='source kind (default: inferred from the extension)')
+
+    missing = subparsers.add_parser('missing', help='columns in one source kind missing from another')
+    missing.add_argument('--source', '-s', choices=KINDS, default='mermaid', help='source kind')
+    missing.add_argument('--target', '-t', choices=KINDS, default='notion', help='target kind')
+    missing.add_argument('--by', choices=('logical', 'physical'), default='logical', help='match columns by name kind')
+
+    subparsers.add_parser('mismatches', help='tables and columns whose logical names differ across sources')
+
+    find = subparsers.add_parser('find', help='find tables and columns by physical or logical name prefix')
+    find.add_argument('name', help='name prefix')
+    args = parser.parse_args(argv)
+
+    catalog = SchemaCatalog(args.catalog)
+    try:
+        if args.command == 'ingest':
+            for file in args.files:
+                changed = catalog.ingest(file, args.kind)
+                print(f"{'ingested' if changed else 'unchanged'}: {file}")
+        elif args.command == 'missing':
+            _write_rows(catalog.missing_columns(args.source, args.target, args.by))
+        elif args.command == 'mismatches':
+            _write_rows(catalog.logical_name_mismatches())
+        elif args.command == 'find':
+            _write_rows(catalog.find(args.name))
+    finally:
+        catalog.close()
+
+
+if __name__ == '__main__':
+    main()
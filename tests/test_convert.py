@@ -0,0 +1,43 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import convert
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+
+@requires_ffmpeg
+def test_estimated_duration_reads_headers_and_falls_back_to_size(tmp_path):
+    wav = str(tmp_path / "short.wav")
+    mp3 = str(tmp_path / "long.mp3")
+    unknown = str(tmp_path / "broken.mp3")
+    convert.save_audio(wav, np.zeros(16000 * 3, dtype=np.float32), 16000)
+    convert.save_audio(mp3, np.zeros(16000 * 10, dtype=np.float32), 16000, format="mp3")
+    with open(unknown, "wb") as f:
+        f.write(b"\0" * convert.FALLBACK_BYTES_PER_SECOND * 2)
+
+    assert convert.estimated_duration(wav) == pytest.approx(3)
+    assert convert.estimated_duration(mp3) == pytest.approx(10, abs=0.1)
+    assert convert.audio_duration(unknown) is None
+    assert convert.estimated_duration(unknown) == pytest.approx(2)
+    # The uncompressed WAV is the larger file, but the MP3 is the longer job
+    files = [wav, mp3, unknown]
+    assert sorted(files, key=convert.estimated_duration, reverse=True) == [mp3, wav, unknown]
+
+
+def test_noise_profile_cache_keeps_the_most_recently_used_profiles(tmp_path):
+    cache = convert.NoiseProfileCache(str(tmp_path), max_entries=2)
+    cache.put("room-a", 16000, np.ones(4))
+    cache.put("room-b", 16000, np.ones(4))
+    # room-a is the older file, but reading it makes room-b the least recently used profile
+    os.utime(tmp_path / "room-a-16000.npy", ns=(0, 0))
+    os.utime(tmp_path / "room-b-16000.npy", ns=(10 ** 9, 10 ** 9))
+    assert cache.get("room-a", 16000) is not None
+
+    cache.put("room-c", 16000, np.ones(4))
+
+    assert sorted(os.listdir(tmp_path)) == ["room-a-16000.npy", "room-c-16000.npy"]
+    assert cache.get("room-b", 16000) is None
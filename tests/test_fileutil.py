@@ -0,0 +1,37 @@
+import hashlib
+import os
+
+import pytest
+
+import fileutil
+
+
+def test_file_digest_matches_sha256(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(os.urandom(3 << 20))
+
+    assert fileutil.file_digest(str(path)) == hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_atomic_write_replaces_the_file(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("old", encoding="utf-8")
+
+    with fileutil.atomic_write(str(path)) as f:
+        f.write("新しい内容")
+
+    assert path.read_text(encoding="utf-8") == "新しい内容"
+    assert os.listdir(tmp_path) == ["state.json"]
+
+
+def test_atomic_write_keeps_the_original_on_error(tmp_path):
+    path = tmp_path / "cache.bin"
+    path.write_bytes(b"old")
+
+    with pytest.raises(RuntimeError):
+        with fileutil.atomic_write(str(path), "wb") as f:
+            f.write(b"partial")
+            raise RuntimeError("interrupted")
+
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["cache.bin"]
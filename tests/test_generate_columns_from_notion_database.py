@@ -0,0 +1,39 @@
+import io
+
+import pytest
+
+from generate_columns_from_notion_database import notion_exports_to_csv, resolve_columns
+
+# Header of a database exported from Notion with its default property names
+NOTION_DEFAULT_HEADER = ['﻿Name', 'Description', 'Tags', 'Type', 'Size']
+
+
+def test_partial_alias_match_falls_back_to_legacy_positions():
+    # Type and Size match aliases but format does not, so none of the aliases are used
+    assert resolve_columns(NOTION_DEFAULT_HEADER) == [0, 1, 3, 4]
+
+
+def test_all_fields_resolved_from_headers():
+    assert resolve_columns(['サイズ', '形式', '種別', '名前']) == [3, 2, 1, 0]
+
+
+def test_explicit_headers_win():
+    headers = {'component_type': 'Tags', 'format': 'Type'}
+    assert resolve_columns(NOTION_DEFAULT_HEADER, headers) == [0, 2, 3, 4]
+
+
+def test_fields_sharing_a_column_are_rejected():
+    with pytest.raises(ValueError, match='component_type and format'):
+        resolve_columns(NOTION_DEFAULT_HEADER, {'format': 'Type'})
+    with pytest.raises(ValueError, match='not found'):
+        resolve_columns(NOTION_DEFAULT_HEADER, {'format': 'Format'})
+
+
+def test_notion_export_rows(tmp_path):
+    export = tmp_path / 'columns.csv'
+    export.write_text('﻿Name,Description,Tags,Type,Size\n'
+                      'ユーザーID,text (テキスト),必須,bigint (整数),20\n', encoding='utf-8')
+    output = io.StringIO()
+
+    assert notion_exports_to_csv([str(export)], output) == 1
+    assert output.getvalue() == 'ユーザーID,text,bigint,20\n'
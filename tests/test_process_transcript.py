@@ -0,0 +1,47 @@
+import process_transcript
+from process_transcript import AdaptiveRateLimiter, estimate_request_tokens
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(round(seconds, 3))
+        self.now += seconds
+
+
+def test_waits_only_when_the_next_chunk_does_not_fit(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(process_transcript.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(process_transcript.time, "sleep", clock.sleep)
+    limiter = AdaptiveRateLimiter()
+    limiter.update({"x-ratelimit-remaining-requests": "10", "x-ratelimit-remaining-tokens": "8000",
+                    "x-ratelimit-reset-tokens": "6s"})
+
+    limiter.wait(estimate_request_tokens("あ" * 2000))
+    assert clock.slept == []
+
+    # A full 10,000-character chunk needs more tokens than remain, so wait for the reset
+    limiter.wait(estimate_request_tokens("あ" * 10000))
+    assert clock.slept == [6.0]
+
+    # After the reset the budget is assumed full again
+    limiter.wait(estimate_request_tokens("あ" * 10000))
+    assert clock.slept == [6.0]
+
+
+def test_waits_for_the_request_budget(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(process_transcript.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(process_transcript.time, "sleep", clock.sleep)
+    limiter = AdaptiveRateLimiter()
+    limiter.update({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1m0s",
+                    "x-ratelimit-remaining-tokens": "100000"})
+
+    limiter.wait(100)
+    assert clock.slept == [60.0]
@@ -0,0 +1,59 @@
+import shutil
+import types
+import wave
+
+import numpy as np
+import pytest
+
+import convert
+import transcribe_audio
+
+pytest.importorskip("webrtcvad")
+pytest.importorskip("pydub")
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+
+def speech_and_silence(layout, sr=16000):
+    """Tones for (seconds, True) entries and silence for (seconds, False), in order."""
+    parts = []
+    for seconds, voiced in layout:
+        t = np.arange(int(seconds * sr)) / sr
+        tone = 0.5 * sum(np.sin(2 * np.pi * 150 * k * t) / k for k in range(1, 6))
+        parts.append(tone if voiced else np.zeros_like(t))
+    return np.concatenate(parts).astype(np.float32)
+
+
+class FakeWhisper:
+    """Returns one segment per chunk whose end overshoots the chunk by overshoot seconds."""
+
+    def __init__(self, overshoot):
+        self.overshoot = overshoot
+        self.audio = types.SimpleNamespace(transcriptions=self)
+
+    def create(self, model, file, response_format=None):
+        name, buffer = file
+        with wave.open(buffer) as f:
+            seconds = f.getnframes() / f.getframerate()
+        segment = types.SimpleNamespace(start=0.0, end=seconds + self.overshoot, text=name)
+        return types.SimpleNamespace(text=name, segments=[segment])
+
+
+def test_restore_timestamps_clamps_to_the_last_region():
+    offset_map = np.array([[0, 16000, 8000], [12800, 160000, 8000]])
+    restored = transcribe_audio.restore_timestamps(offset_map, [0.25, 0.6, 1.05, 5.0], 16000)
+    assert restored.tolist() == [1.25, 1.5, 10.25, 10.5]
+
+
+@requires_ffmpeg
+def test_segment_end_past_its_chunk_stays_in_that_chunk(tmp_path):
+    audio = speech_and_silence([(1, False), (4, True), (60, False), (4, True), (1, False)])
+    path = str(tmp_path / "meeting.wav")
+    convert.save_audio(path, audio, 16000)
+
+    _, segments = transcribe_audio.transcribe_speech(
+        path, client=FakeWhisper(overshoot=2.0), concurrency=1, max_chunk_seconds=5, format="wav")
+
+    # The first chunk ends with the first speech region, well before the second one at 65 s
+    assert segments[0]["end"] < 6
+    assert all(segment["end"] <= following["start"] for segment, following in zip(segments, segments[1:]))
+    assert segments[-1]["end"] <= 70
@@ -0,0 +1,270 @@
+import contextlib
+import os
+import shutil
+import time
+import wave
+
+import numpy as np
+import pytest
+
+import metrics
+import transcribe_audio_gcp
+
+speech = pytest.importorskip("google.cloud.speech")
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+
+
+def write_wav(path, seconds, sr=16000):
+    t = np.arange(int(seconds * sr)) / sr
+    samples = (0.3 * np.sin(2 * np.pi * 220 * t) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes(samples.tobytes())
+    return str(path)
+
+
+def final_response(text):
+    return speech.StreamingRecognizeResponse(results=[speech.StreamingRecognitionResult(
+        is_final=True, alternatives=[speech.SpeechRecognitionAlternative(transcript=text)])])
+
+
+class FakeStreamingClient:
+    """Consumes every request of a stream and answers with one final result per stream."""
+
+    def __init__(self):
+        self.streams = []
+
+    def streaming_recognize(self, config, requests):
+        audio = b"".join(request.audio_content for request in requests)
+        self.streams.append(audio)
+        return iter([final_response(f"stream {len(self.streams)}")])
+
+
+@pytest.fixture
+def metrics_off():
+    metrics.close()
+    yield
+    metrics.close()
+
+
+@requires_ffmpeg
+def test_streaming_without_metrics(tmp_path, metrics_off):
+    audio = write_wav(tmp_path / "speech.wav", 3)
+    client = FakeStreamingClient()
+    output = tmp_path / "out" / "speech.txt"
+
+    text = transcribe_audio_gcp.transcribe_audio_streaming(
+        audio, str(output), speech_client=client, stream_limit_seconds=1, max_speed=0)
+
+    assert text == "stream 1\nstream 2\nstream 3"
+    assert [len(stream) for stream in client.streams] == [32000, 32000, 32000]
+    assert output.read_text(encoding="utf-8") == "stream 1\nstream 2\nstream 3\n"
+
+
+@requires_ffmpeg
+def test_streaming_records_bytes_sent(tmp_path, metrics_off):
+    audio = write_wav(tmp_path / "speech.wav", 1.5)
+    metrics.enable_collecting()
+
+    transcribe_audio_gcp.transcribe_audio_streaming(
+        audio, speech_client=FakeStreamingClient(), stream_limit_seconds=1, max_speed=0)
+
+    calls = [event for event in metrics.collect() if event["type"] == "api_call"]
+    assert [call["bytes_sent"] for call in calls] == [32000, 16000]
+    assert all(call["status"] == "ok" for call in calls)
+
+
+@requires_ffmpeg
+def test_streaming_is_paced_to_real_time_by_default(tmp_path, metrics_off):
+    audio = write_wav(tmp_path / "speech.wav", 0.5)
+    client = FakeStreamingClient()
+
+    start = time.monotonic()
+    transcribe_audio_gcp.transcribe_audio_streaming(audio, speech_client=client)
+
+    # Five 100 ms chunks; the last one may go out as soon as the fourth has been paced
+    assert time.monotonic() - start >= 0.4
+    assert [len(stream) for stream in client.streams] == [16000]
+
+
+@pytest.fixture
+def fake_speech_server():
+    """A local gRPC server implementing StreamingRecognize, like the one --endpoint is meant for."""
+    grpc = pytest.importorskip("grpc")
+    from concurrent import futures
+
+    streams = []
+
+    def streaming_recognize(requests, context):
+        audio = b"".join(request.audio_content for request in requests)
+        streams.append(audio)
+        yield final_response(f"{len(audio)} bytes")
+
+    handler = grpc.method_handlers_generic_handler("google.cloud.speech.v1.Speech", {
+        "StreamingRecognize": grpc.stream_stream_rpc_method_handler(
+            streaming_recognize,
+            request_deserializer=speech.StreamingRecognizeRequest.deserialize,
+            response_serializer=speech.StreamingRecognizeResponse.serialize,
+        ),
+    })
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    server.add_generic_rpc_handlers((handler,))
+    port = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    yield f"127.0.0.1:{port}", streams
+    server.stop(None)
+
+
+@requires_ffmpeg
+def test_streaming_against_fake_servicer(tmp_path, metrics_off, fake_speech_server):
+    endpoint, streams = fake_speech_server
+    audio = write_wav(tmp_path / "speech.wav", 2.5)
+
+    text = transcribe_audio_gcp.transcribe_audio_streaming(
+        audio, endpoint=endpoint, stream_limit_seconds=1, max_speed=0)
+
+    assert text == "32000 bytes\n32000 bytes\n16000 bytes"
+    assert [len(stream) for stream in streams] == [32000, 32000, 16000]
+
+
+class FakeOperation:
+    """Long-running operation that is done after a number of polls."""
+
+    def __init__(self, uri, polls_needed=2, text=None):
+        self.uri = uri
+        self.polls_needed = polls_needed
+        self.polls = 0
+        self.text = text or uri
+
+    def done(self):
+        self.polls += 1
+        return self.polls >= self.polls_needed
+
+    def result(self, timeout=None):
+        return speech.LongRunningRecognizeResponse(results=[speech.SpeechRecognitionResult(
+            alternatives=[speech.SpeechRecognitionAlternative(transcript=self.text)])])
+
+
+class FakeSpeechClient:
+    def __init__(self, polls_needed=2):
+        self.polls_needed = polls_needed
+        self.recognized = 0
+        self.operations = []
+
+    def recognize(self, config, audio):
+        self.recognized += 1
+        return speech.RecognizeResponse(results=[speech.SpeechRecognitionResult(
+            alternatives=[speech.SpeechRecognitionAlternative(transcript="inline text")])])
+
+    def long_running_recognize(self, config, audio):
+        operation = FakeOperation(audio.uri, self.polls_needed)
+        self.operations.append(operation)
+        return operation
+
+
+class FakeBlob:
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+
+    def upload_from_filename(self, file_path):
+        self.storage.uploaded.append(self.name)
+
+
+class FakeStorageClient:
+    def __init__(self):
+        self.uploaded = []
+        self.deleted = []
+        self.batches = 0
+
+    def bucket(self, name):
+        bucket = type("FakeBucket", (), {})()
+        bucket.name = name
+        bucket.client = self
+        bucket.blob = lambda blob_name: FakeBlob(self, blob_name)
+        bucket.delete_blobs = lambda blobs, on_error=None: self.deleted.extend(blob.name for blob in blobs)
+        return bucket
+
+    @contextlib.contextmanager
+    def batch(self):
+        self.batches += 1
+        yield
+
+
+def test_batch_transcribes_inline_and_long_running_files(tmp_path, metrics_off):
+    short = write_wav(tmp_path / "short.wav", 1)
+    long = write_wav(tmp_path / "long.wav", 4)
+    storage = FakeStorageClient()
+    client = FakeSpeechClient()
+
+    results = transcribe_audio_gcp.transcribe_batch(
+        [short, long], str(tmp_path / "out"), bucket_name="bucket", inline_max_seconds=2,
+        poll_interval=0.01, speech_client=client, storage_client=storage)
+
+    assert results == {short: str(tmp_path / "out" / "short.txt"), long: str(tmp_path / "out" / "long.txt")}
+    assert (tmp_path / "out" / "short.txt").read_text(encoding="utf-8") == "inline text\n"
+    assert (tmp_path / "out" / "long.txt").read_text(encoding="utf-8").startswith("gs://bucket/audio_transcription/")
+    assert client.recognized == 1 and len(client.operations) == 1
+    assert len(storage.uploaded) == 1
+    assert sorted(storage.deleted) == sorted(storage.uploaded)
+
+
+def test_batch_reports_a_failed_start_and_deletes_every_blob(tmp_path, metrics_off):
+    files = [write_wav(tmp_path / f"{name}.wav", 3) for name in ("a", "b", "c")]
+    storage = FakeStorageClient()
+    client = FakeSpeechClient()
+    started = []
+
+    # The second operation fails to start after its file was uploaded
+
+    def long_running_recognize(config, audio):
+        started.append(audio.uri)
+        if len(started) == 2:
+            raise RuntimeError("recognition could not start")
+        return FakeSpeechClient.long_running_recognize(client, config, audio)
+
+    client.long_running_recognize = long_running_recognize
+
+    results = transcribe_audio_gcp.transcribe_batch(
+        files, str(tmp_path / "out"), bucket_name="bucket", inline_max_seconds=0, concurrency=1,
+        poll_interval=0.01, speech_client=client, storage_client=storage)
+
+    failed = [path for path, result in results.items() if isinstance(result, Exception)]
+    assert len(failed) == 1 and "could not start" in str(results[failed[0]])
+    assert len(storage.uploaded) == 3
+    assert sorted(storage.deleted) == sorted(storage.uploaded)
+    assert sorted(os.listdir(tmp_path / "out")) == sorted(
+        os.path.basename(path)[:-4] + ".txt" for path in files if path not in failed)
+
+
+def test_batch_polls_with_backoff_and_gives_up_at_the_timeout(tmp_path, metrics_off, monkeypatch):
+    slept = []
+    monkeypatch.setattr(transcribe_audio_gcp.time, "sleep", slept.append)
+    files = [write_wav(tmp_path / "slow.wav", 3), write_wav(tmp_path / "stuck.wav", 3)]
+    storage = FakeStorageClient()
+    client = FakeSpeechClient()
+    # Every clock reading advances one second, so the 30 s timeout is reached after a few dozen polls
+    clock = iter(range(1000))
+    monkeypatch.setattr(transcribe_audio_gcp.time, "monotonic", lambda: next(clock))
+
+    # The first operation finishes after five polls, the second never does
+    def long_running_recognize(config, audio):
+        operation = FakeOperation(audio.uri, polls_needed=5 if not client.operations else 10 ** 6)
+        client.operations.append(operation)
+        return operation
+
+    client.long_running_recognize = long_running_recognize
+
+    results = transcribe_audio_gcp.transcribe_batch(
+        files, str(tmp_path / "out"), bucket_name="bucket", inline_max_seconds=0, concurrency=1,
+        poll_interval=1, max_poll_interval=4, timeout=30, speech_client=client, storage_client=storage)
+
+    outcomes = sorted(type(result).__name__ for result in results.values())
+    assert outcomes == ["TimeoutError", "str"]
+    # Delays double while nothing finishes, are capped, and reset after progress
+    assert slept[0] == 1
+    assert all(after in (1, min(2 * before, 4)) for before, after in zip(slept, slept[1:]))
+    assert max(slept) == 4 and 1 in slept[slept.index(4):]
+    assert sorted(storage.deleted) == sorted(storage.uploaded) and len(storage.uploaded) == 2
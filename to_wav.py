@@ -1,7 +1,26 @@
-from pydub import AudioSegment
+import argparse
+import os
 
-# MP3ファイルを読み込む
-audio = AudioSegment.from_mp3("/Users/murakaminaoya/Downloads/audio.mp3")
 
-# WAVファイルとして書き出す
-audio.export("124.wav", format="wav")
+def to_wav(input_file, output_file):
+    """ MP3 などの音声ファイルを WAV に変換 """
+    from pydub import AudioSegment
+
+    # MP3ファイルを読み込む
+    audio = AudioSegment.from_file(input_file)
+
+    # WAVファイルとして書き出す
+    audio.export(output_file, format="wav")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="音声ファイルを WAV に変換する")
+    parser.add_argument("input_file", help="入力ファイルのパス")
+    parser.add_argument("-o", "--output_file", help="出力ファイルのパス（省略時は入力と同名の .wav）")
+    args = parser.parse_args(argv)
+
+    output_file = args.output_file or os.path.splitext(args.input_file)[0] + ".wav"
+    to_wav(args.input_file, output_file)
+    print(f"変換が完了しました: {output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import importlib
+import sys
+import time
+
+# サブコマンド名: (モジュール, エントリポイント, 説明)
+# モジュールはサブコマンドを実行するときに初めて import する
+COMMANDS = {
+    "convert": ("convert", "main", "音声ファイルをノイズ除去・バンドパス・VAD で前処理する"),
+    "to-wav": ("to_wav", "main", "音声ファイルを WAV に変換する"),
+    "transcribe": ("transcribe_audio", "main", "OpenAI Whisper で文字起こしする"),
+    "transcribe-gcp": ("transcribe_audio_gcp", "main", "Google Cloud Speech-to-Text で文字起こしする"),
+    "pipeline": ("pipeline", "main", "前処理・文字起こし・整形をチャンク単位で並行して一度に行う"),
+    "format": ("format_transcription", "cli", "文字起こしを読みやすく整形する"),
+    "process": ("process_transcript", "main", "文字起こしを自然な文章に修正する"),
+    "translate": ("translate_csv_row", "main", "CSV の日本語の列を英語の snake_case に翻訳する"),
+    "glossary": ("glossary", "main", "翻訳用語集を参照・編集する"),
+    "mermaid-columns": ("generate_columns_from_mermaid", "main", "Mermaid ER 図からカラム一覧 CSV を生成する"),
+    "mermaid-tables": ("generate_table_name_csv_from_mermaid", "main", "Mermaid ER 図からテーブル名 CSV を生成する"),
+    "markdown": ("markdown_to_csv", "main", "マスターデータの Markdown を CSV に変換する"),
+    "notion-columns": ("generate_columns_from_notion_database", "main", "Notion のエクスポートからカラム一覧を生成する"),
+    "catalog": ("schema_catalog", "main", "Mermaid・Markdown・Notion のスキーマをカタログに取り込んで照合する"),
+    "bench": ("benchmark", "main", "合成データで音声・テキスト処理の性能を計測する"),
+}
+
+
+def usage():
+    lines = [
+        "usage: tools.py [--timing] <command> [args...]",
+        "",
+        "commands:",
+    ]
+    width = max(map(len, COMMANDS))
+    lines += [f"  {name:<{width}}  {description}" for name, (_, _, description) in COMMANDS.items()]
+    lines += [
+        "",
+        "options:",
+        "  --timing  サブコマンドの import 時間と実行時間を標準エラーに出力する",
+        "",
+        "各コマンドのオプションは tools.py <command> --help を参照",
+    ]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    timing = "--timing" in argv[:1]
+    if timing:
+        argv = argv[1:]
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0 if argv else 2
+    name, args = argv[0], argv[1:]
+    if name not in COMMANDS:
+        print(f"不明なコマンドです: {name}\n\n{usage()}", file=sys.stderr)
+        return 2
+
+    module_name, entry_point, _ = COMMANDS[name]
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    imported = time.perf_counter()
+    if timing:
+        print(f"[timing] import {module_name}: {(imported - start) * 1000:.1f} ms", file=sys.stderr)
+    try:
+        result = getattr(module, entry_point)(args)
+    finally:
+        if timing:
+            print(f"[timing] run {name}: {(time.perf_counter() - imported) * 1000:.1f} ms", file=sys.stderr)
+    return result if isinstance(result, int) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
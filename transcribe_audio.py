@@ -1,56 +1,402 @@
 import argparse
+import hashlib
+import io
+import json
 import math
 import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, Optional, Tuple
 
-from moviepy.audio.io.AudioFileClip import AudioFileClip
-from openai import OpenAI
-from pydub import AudioSegment
+import metrics
+from fileutil import atomic_write
 
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "transcribe_audio")
+# Largest file the Whisper API accepts
+WHISPER_MAX_BYTES = 25 * 1024 * 1024
 
-def split_audio(file_path: str, chunk_size_mb: int = 24) -> List[str]:
+
+class TranscriptionCache:
+    """
+    On-disk transcription cache keyed by a hash of the audio bytes, model and parameters.
+
+    Transcripts are stored as `<cache_dir>/<key>.txt`. Job manifests in `<cache_dir>/jobs/`
+    record the ordered chunk keys of each input file so an interrupted run can report and
+    resume from the first chunk that is not cached yet.
+    """
+
+    def __init__(self, cache_dir: str, model: str = "whisper-1", params: Optional[dict] = None):
+        self.cache_dir = cache_dir
+        self.model = model
+        self.params = params or {}
+        os.makedirs(os.path.join(cache_dir, "jobs"), exist_ok=True)
+
+    def key(self, data: bytes) -> str:
+        digest = hashlib.sha256(data)
+        digest.update(json.dumps({"model": self.model, **self.params}, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.cache_dir, f"{key}.txt"), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, text: str) -> None:
+        with atomic_write(os.path.join(self.cache_dir, f"{key}.txt")) as f:
+            f.write(text)
+
+    def job_id(self, file_path: str) -> str:
+        stat = os.stat(file_path)
+        identity = f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}:{self.model}"
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def load_manifest(self, job_id: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.cache_dir, "jobs", f"{job_id}.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def save_manifest(self, job_id: str, manifest: dict) -> None:
+        with atomic_write(os.path.join(self.cache_dir, "jobs", f"{job_id}.json")) as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+def split_audio(file_path: str, chunk_size_mb: int = 24) -> Iterator[Tuple[str, io.BytesIO]]:
     """
-    Split an audio file into smaller chunks.
+    Split an audio file into smaller in-memory chunks.
+
+    The file is decoded once; the duration comes from the decoded segment. Each chunk is
+    encoded into a memory buffer, and if the encoded size exceeds the limit the chunk is
+    re-encoded with a proportionally shorter duration. Chunks are yielded lazily.
 
     Args:
         file_path (str): Path to the audio file
         chunk_size_mb (int): Maximum size of each chunk in MB
 
-    Returns:
-        List[str]: List of paths to the chunk files
+    Yields:
+        Tuple[str, io.BytesIO]: File name and encoded audio buffer of each chunk
     """
     # Get file extension
     _, ext = os.path.splitext(file_path)
+    max_bytes = chunk_size_mb * 1024 * 1024
 
     # Load audio file
-    audio = AudioSegment.from_file(file_path)
+    from pydub import AudioSegment
+
+    with metrics.stage("decode", file=file_path):
+        audio = AudioSegment.from_file(file_path)
 
-    # Calculate chunk duration based on file size and total duration
+    # Calculate chunk duration to achieve desired chunk size from the source bitrate
     file_size = os.path.getsize(file_path)
-    audio_clip = AudioFileClip(file_path)
-    duration = audio_clip.duration
-    audio_clip.close()
+    chunk_duration_ms = max(1, int(max_bytes * len(audio) / file_size))
 
-    # Calculate chunk duration to achieve desired chunk size
-    chunk_duration = (chunk_size_mb * 1024 * 1024 * duration) / file_size
-    chunk_duration_ms = int(chunk_duration * 1000)  # Convert to milliseconds
+    chunk_start = 0
+    i = 0
+    while chunk_start < len(audio):
+        chunk = audio[chunk_start:chunk_start + chunk_duration_ms]
+        buffer = io.BytesIO()
+        with metrics.stage("export_chunk", file=file_path):
+            chunk.export(buffer, format=ext[1:])  # Remove dot from extension
+        size = buffer.getbuffer().nbytes
+        if size > max_bytes and len(chunk) > 1:
+            # Encoded chunk is too large; shrink the duration with a small safety margin and retry
+            chunk_duration_ms = int(len(chunk) * max_bytes / size * 0.98)
+            continue
+        buffer.seek(0)
+        yield f"chunk_{i}{ext}", buffer
+        chunk_start += len(chunk)
+        i += 1
 
-    # Create chunks directory
-    base_dir = os.path.dirname(file_path)
-    chunks_dir = os.path.join(base_dir, "audio_chunks")
-    os.makedirs(chunks_dir, exist_ok=True)
+def _is_retryable(error: Exception) -> bool:
+    """Return True for rate-limit (429), server-side (5xx) and connection errors."""
+    from openai import APIConnectionError
 
-    chunk_paths = []
-    for i, chunk_start in enumerate(range(0, len(audio), chunk_duration_ms)):
-        chunk = audio[chunk_start:chunk_start + chunk_duration_ms]
-        chunk_path = os.path.join(chunks_dir, f"chunk_{i}{ext}")
-        chunk.export(chunk_path, format=ext[1:])  # Remove dot from extension
-        chunk_paths.append(chunk_path)
+    if isinstance(error, APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
+
+def _upload_size(file) -> int:
+    """Size in bytes of a file object or (name, buffer) tuple about to be uploaded."""
+    if isinstance(file, tuple):
+        return file[1].getbuffer().nbytes
+    return os.fstat(file.fileno()).st_size
+
+def transcribe_chunk(client, file, max_retries: int = 5, backoff: float = 1.0, verbose: bool = False):
+    """
+    Transcribe a single file or chunk, retrying with exponential backoff on 429/5xx.
+
+    Args:
+        client (OpenAI): OpenAI client
+        file: File object or (name, buffer) tuple to upload
+        max_retries (int): Maximum number of retries
+        backoff (float): Initial backoff in seconds, doubled on every retry
+        verbose (bool): Request verbose_json and return the segment timestamps as well
+
+    Returns:
+        str: Transcribed text, or with verbose a dict with "text" and "segments"
+            (a list of {"start", "end", "text"} in seconds from the start of the chunk)
+    """
+    with metrics.api_call("openai.audio.transcriptions", model="whisper-1") as call:
+        for attempt in range(max_retries + 1):
+            call["retries"] = attempt
+            try:
+                if hasattr(file, "seek"):
+                    file.seek(0)
+                elif isinstance(file, tuple):
+                    file[1].seek(0)
+                if metrics.is_enabled():
+                    call["bytes_sent"] += _upload_size(file)
+                if verbose:
+                    transcript = client.audio.transcriptions.create(
+                        model="whisper-1",
+                        file=file,
+                        response_format="verbose_json",
+                    )
+                    return {
+                        "text": transcript.text,
+                        "segments": [
+                            {"start": segment.start, "end": segment.end, "text": segment.text}
+                            for segment in transcript.segments or []
+                        ],
+                    }
+                transcript = client.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=file
+                )
+                return transcript.text
+            except Exception as e:
+                if attempt == max_retries or not _is_retryable(e):
+                    raise
+                delay = backoff * 2 ** attempt + random.uniform(0, backoff)
+                print(f"Retrying in {delay:.1f}s after error: {e}")
+                time.sleep(delay)
+
+def transcribe_chunks(client, chunks: Iterable[Tuple[str, io.BytesIO]], concurrency: int = 4,
+                      cache: Optional[TranscriptionCache] = None, job_id: Optional[str] = None,
+                      verbose: bool = False) -> list:
+    """
+    Transcribe chunks concurrently and return the transcripts in chunk order.
+
+    At most `concurrency` chunks are in flight at a time, so chunks are pulled lazily
+    from the iterator and decoded audio is not held for the whole file. With a cache,
+    chunks whose audio was already transcribed are served from disk without an upload,
+    and every finished chunk is persisted as soon as it completes.
+
+    Args:
+        client (OpenAI): OpenAI client
+        chunks (Iterable[Tuple[str, io.BytesIO]]): Chunks as yielded by split_audio
+        concurrency (int): Maximum number of concurrent uploads
+        cache (TranscriptionCache, optional): Cache for chunk transcripts
+        job_id (str, optional): Job manifest to record chunk keys in (requires cache)
+        verbose (bool): Return verbose results with segment timestamps (see transcribe_chunk).
+            The cache should then be created with params that tell the two kinds apart.
+
+    Returns:
+        list: Transcribed text (or verbose result) of each chunk, in chunk order
+    """
+    manifest = cache.load_manifest(job_id) if cache and job_id else None
+    if manifest:
+        done = sum(cache.get(key) is not None for key in manifest["chunks"])
+        print(f"Resuming job: {done}/{len(manifest['chunks'])} chunks already transcribed")
+    keys = []
+
+    def run(index, chunk, key):
+        # The stage covers only the upload and the wait for Whisper; decoding and encoding the
+        # chunk happen in the chunks iterator and are measured by their own stages
+        with metrics.stage("transcribe", chunk=index):
+            result = transcribe_chunk(client, chunk, verbose=verbose)
+        if cache:
+            cache.put(key, json.dumps(result, ensure_ascii=False) if verbose else result)
+        return result
+
+    futures = []
+    in_flight = set()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for i, chunk in enumerate(chunks):
+                key = cache.key(chunk[1].getvalue()) if cache else None
+                keys.append(key)
+                cached = cache.get(key) if cache else None
+                if cached is not None:
+                    print(f"Chunk {i+1} found in cache")
+                    future = Future()
+                    future.set_result(json.loads(cached) if verbose else cached)
+                    futures.append(future)
+                    continue
+                if len(in_flight) >= concurrency:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                print(f"Processing chunk {i+1}...")
+                future = executor.submit(run, i, chunk, key)
+                futures.append(future)
+                in_flight.add(future)
+        return [future.result() for future in futures]
+    finally:
+        if cache and job_id:
+            cache.save_manifest(job_id, {
+                "chunks": keys,
+                "complete": bool(futures) and all(f.done() and not f.exception() for f in futures),
+            })
+
+def pack_speech(audio, sr: int, max_chunk_seconds: float = 600, padding_ms: int = 300,
+                gap_seconds: float = 0.3) -> Tuple[list, "np.ndarray"]:
+    """
+    Keep only the speech regions found by VAD and pack them into chunks.
+
+    Regions are separated by gap_seconds of silence so Whisper still hears a pause between
+    them, and a region is never split across chunks unless it alone exceeds the chunk length.
+
+    Args:
+        audio (np.ndarray): Mono float audio
+        sr (int): Sample rate
+        max_chunk_seconds (float): Maximum duration of each packed chunk
+        padding_ms (int): Audio kept before and after each detected speech region
+        gap_seconds (float): Silence inserted between packed regions
+
+    Returns:
+        Tuple[list, np.ndarray]: Packed chunks, and the offset map as an (n, 3) array of
+            (packed start, original start, length) in samples, where packed positions run
+            continuously across all chunks
+    """
+    import numpy as np
+    import convert
+
+    max_samples = int(sr * max_chunk_seconds)
+    gap = np.zeros(int(sr * gap_seconds), dtype=np.float32)
+    regions = []
+    for start, end in convert.vad_segments(audio, sr, padding_ms=padding_ms):
+        for piece in range(start, end, max_samples - len(gap)):
+            regions.append((piece, min(end, piece + max_samples - len(gap))))
+
+    chunks, offset_map = [], []
+    parts, length, packed = [], 0, 0
+    for start, end in regions:
+        if parts and length + len(gap) + end - start > max_samples:
+            chunks.append(np.concatenate(parts))
+            parts, length = [], 0
+        if parts:
+            parts.append(gap)
+            length += len(gap)
+            packed += len(gap)
+        offset_map.append((packed, start, end - start))
+        parts.append(np.asarray(audio[start:end], dtype=np.float32))
+        length += end - start
+        packed += end - start
+    if parts:
+        chunks.append(np.concatenate(parts))
+    return chunks, np.array(offset_map, dtype=np.int64).reshape(-1, 3)
+
+def restore_timestamps(offset_map, packed_seconds, sr: int):
+    """
+    Map times on the packed timeline back to the original recording.
+
+    A time that falls in an inserted gap is mapped to the end of the preceding region, and a
+    time past the last region of offset_map is clamped to its end. Pass only the rows of one
+    chunk so that a segment end running past its chunk is not mapped into the next chunk,
+    which can be much later in the recording.
+    """
+    import numpy as np
+
+    packed = np.asarray(packed_seconds, dtype=np.float64) * sr
+    index = np.maximum(np.searchsorted(offset_map[:, 0], packed, side="right") - 1, 0)
+    packed_start, original_start, length = (offset_map[index, column] for column in range(3))
+    return (original_start + np.clip(packed - packed_start, 0, length)) / sr
+
+def transcribe_speech(file_path, output_path=None, api_key=None, concurrency=4, cache_dir=None,
+                      segments_path=None, max_chunk_seconds=600, format="mp3", bitrate="64k", client=None):
+    """
+    Transcribe only the speech in an audio file, with timestamps on the original timeline.
+
+    The file is decoded and run through VAD, and only the speech regions are packed into the
+    chunks that are uploaded (see pack_speech). Whisper is asked for verbose_json, and the
+    segment timestamps it returns are mapped back through the offset map.
+
+    Args:
+        file_path (str): Path to the audio file
+        output_path (str, optional): Path to save the transcription. If not provided, only returns the text
+        api_key (str, optional): OpenAI API key. If not provided, will look for OPENAI_API_KEY env variable
+        concurrency (int, optional): Maximum number of chunks uploaded concurrently
+        cache_dir (str, optional): Directory of the transcription cache. If not provided, caching is disabled
+        segments_path (str, optional): Path to save the segments with original timestamps as JSON
+        max_chunk_seconds (float, optional): Maximum duration of speech per uploaded chunk
+        format (str, optional): Encoding of the uploaded chunks
+        bitrate (str, optional): Bitrate of the uploaded chunks
+        client (OpenAI, optional): Client to use instead of creating one
+
+    Returns:
+        Tuple[str, List[dict]]: Transcribed text, and segments as {"start", "end", "text"}
+            with times in seconds on the original recording
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Audio file not found: {file_path}")
+
+    if client is None:
+        api_key = api_key or os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            raise ValueError("OpenAI API key not found. Please provide it as an argument or set OPENAI_API_KEY environment variable")
+
+        from openai import OpenAI
+
+        client = OpenAI(api_key=api_key)
+
+    import numpy as np
+    from pydub import AudioSegment
+    import convert
+
+    sr = 16000
+    with metrics.stage("decode", file=file_path):
+        audio, _ = convert.load_audio(file_path, sr=sr)
+    with metrics.stage("vad", file=file_path):
+        chunks, offset_map = pack_speech(audio, sr, max_chunk_seconds)
+    speech_seconds = int(offset_map[:, 2].sum()) / sr if len(offset_map) else 0.0
+    print(f"Uploading {speech_seconds:.0f}s of speech out of {len(audio) / sr:.0f}s "
+          f"({100 * (1 - speech_seconds / max(len(audio) / sr, 1e-9)):.0f}% silence removed)")
+
+    def encoded():
+        for i, chunk in enumerate(chunks):
+            buffer = io.BytesIO()
+            with metrics.stage("export_chunk", file=file_path):
+                AudioSegment(convert._to_int16(chunk).tobytes(), frame_rate=sr, sample_width=2, channels=1) \
+                    .export(buffer, format=format, bitrate=bitrate)
+            buffer.seek(0)
+            yield f"speech_{i}.{format}", buffer
+
+    cache = TranscriptionCache(cache_dir, params={"response_format": "verbose_json"}) if cache_dir else None
+    try:
+        results = transcribe_chunks(client, encoded(), concurrency=concurrency, cache=cache, verbose=True)
+    except Exception as e:
+        raise Exception(f"Error during transcription: {str(e)}")
+
+    segments = []
+    chunk_offset = 0
+    for chunk, result in zip(chunks, results):
+        times = np.array([[segment["start"], segment["end"]] for segment in result["segments"]]).reshape(-1, 2)
+        # Consecutive chunks are contiguous on the packed timeline, so map each chunk through its own regions only
+        in_chunk = (offset_map[:, 0] >= chunk_offset) & (offset_map[:, 0] < chunk_offset + len(chunk))
+        restored = restore_timestamps(offset_map[in_chunk], times + chunk_offset / sr, sr)
+        segments += [
+            {"start": round(float(start), 3), "end": round(float(end), 3), "text": segment["text"]}
+            for segment, (start, end) in zip(result["segments"], restored)
+        ]
+        chunk_offset += len(chunk)
+    transcribed_text = "".join(result["text"] + "\n" for result in results)
 
-    return chunk_paths
+    if output_path:
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(transcribed_text)
+    if segments_path:
+        with atomic_write(segments_path) as f:
+            json.dump(segments, f, ensure_ascii=False, indent=1)
+    return transcribed_text, segments
 
-def transcribe_audio(file_path, output_path=None, api_key=None):
+def transcribe_audio(file_path, output_path=None, api_key=None, concurrency=4, cache_dir=None):
     """
     Transcribe an audio file using OpenAI's Whisper model.
 
@@ -58,6 +404,8 @@ def transcribe_audio(file_path, output_path=None, api_key=None):
         file_path (str): Path to the audio file
         output_path (str, optional): Path to save the transcription. If not provided, only returns the text
         api_key (str, optional): OpenAI API key. If not provided, will look for OPENAI_API_KEY env variable
+        concurrency (int, optional): Maximum number of chunks uploaded concurrently for large files
+        cache_dir (str, optional): Directory of the transcription cache and job manifests. If not provided, caching is disabled
 
     Returns:
         str: Transcribed text
@@ -70,39 +418,31 @@ def transcribe_audio(file_path, output_path=None, api_key=None):
     if not api_key:
         raise ValueError("OpenAI API key not found. Please provide it as an argument or set OPENAI_API_KEY environment variable")
 
+    from openai import OpenAI
+
     client = OpenAI(api_key=api_key)
+    cache = TranscriptionCache(cache_dir) if cache_dir else None
 
     try:
         # Split audio if file is too large (>25MB)
-        if os.path.getsize(file_path) > 25 * 1024 * 1024:
+        if os.path.getsize(file_path) > WHISPER_MAX_BYTES:
             print("Audio file is larger than 25MB. Splitting into chunks...")
-            chunk_paths = split_audio(file_path)
-            transcribed_text = ""
-
-            for i, chunk_path in enumerate(chunk_paths):
-                print(f"Processing chunk {i+1}/{len(chunk_paths)}...")
-                with open(chunk_path, "rb") as audio_file:
-                    transcript = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file
-                    )
-                    transcribed_text += transcript.text + "\n"
-
-                # Clean up chunk
-                os.remove(chunk_path)
-
-            # Remove chunks directory if empty
-            chunks_dir = os.path.dirname(chunk_paths[0])
-            if not os.listdir(chunks_dir):
-                os.rmdir(chunks_dir)
+            job_id = cache.job_id(file_path) if cache else None
+            transcripts = transcribe_chunks(client, split_audio(file_path), concurrency=concurrency,
+                                            cache=cache, job_id=job_id)
+            transcribed_text = "".join(text + "\n" for text in transcripts)
         else:
             # Process single file if size is acceptable
             with open(file_path, "rb") as audio_file:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file
-                )
-                transcribed_text = transcript.text
+                key = cache.key(audio_file.read()) if cache else None
+                transcribed_text = cache.get(key) if cache else None
+                if transcribed_text is None:
+                    with metrics.stage("transcribe", file=file_path):
+                        transcribed_text = transcribe_chunk(client, audio_file)
+                    if cache:
+                        cache.put(key, transcribed_text)
+                else:
+                    print("Transcription found in cache")
 
         if output_path:
             output_dir = os.path.dirname(output_path)
@@ -115,15 +455,28 @@ def transcribe_audio(file_path, output_path=None, api_key=None):
     except Exception as e:
         raise Exception(f"Error during transcription: {str(e)}")
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Transcribe audio file using OpenAI Whisper')
     parser.add_argument('file_path', help='Path to the audio file')
     parser.add_argument('-o', '--output', help='Path to save the transcription (optional)')
     parser.add_argument('--api-key', help='OpenAI API key (optional if OPENAI_API_KEY env variable is set)')
-    args = parser.parse_args()
+    parser.add_argument('--concurrency', type=int, default=4, help='Maximum number of chunks uploaded concurrently (default: 4)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'Transcription cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the transcription cache')
+    parser.add_argument('--strip-silence', action='store_true', help='Upload only the speech regions found by VAD and map timestamps back to the original recording')
+    parser.add_argument('--segments', help='With --strip-silence: path to save segments with original timestamps as JSON (optional)')
+    parser.add_argument('--metrics', help='Write per-stage and per-API-call metrics to this file (.prom for a Prometheus textfile, JSON lines otherwise)')
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable(args.metrics)
 
     try:
-        transcription = transcribe_audio(args.file_path, args.output, args.api_key)
+        cache_dir = None if args.no_cache else args.cache_dir
+        if args.strip_silence:
+            transcription, _ = transcribe_speech(args.file_path, args.output, args.api_key, args.concurrency,
+                                                 cache_dir, segments_path=args.segments)
+        else:
+            transcription = transcribe_audio(args.file_path, args.output, args.api_key, args.concurrency, cache_dir)
         print("Transcription completed successfully")
         if args.output:
             print(f"Transcription saved to: {args.output}")
@@ -1,21 +1,231 @@
 import argparse
+import itertools
 import os
+import struct
+import subprocess
+import tempfile
+import time
 import uuid
+from typing import NamedTuple, Optional
 
-from google.cloud import speech, storage
+import metrics
 
 
-def transcribe_audio(file_path, output_path=None, credentials_path=None, bucket_name=None):
+# Limits for sending content inline to synchronous recognize (the API allows 1 minute / 10 MB)
+INLINE_MAX_SECONDS = 60
+INLINE_MAX_BYTES = 10 * 1024 * 1024
+# Sample rates accepted with OGG_OPUS
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+class AudioInfo(NamedTuple):
+    encoding: str  # name of a speech.RecognitionConfig.AudioEncoding
+    sample_rate: int
+    channels: int
+    duration: Optional[float]  # seconds, or None if the header does not tell
+
+
+def _probe_wav(file_path):
+    import convert
+
+    layout = convert._wav_layout(file_path)
+    if layout is None:
+        return None
+    format_tag, channels, rate, bits, _, size = layout
+    if format_tag == 1 and bits == 16:
+        encoding = "LINEAR16"
+    elif format_tag == 7 and bits == 8:
+        encoding = "MULAW"
+    else:
+        return None
+    return AudioInfo(encoding, rate, channels, size / (rate * channels * bits // 8))
+
+
+def _probe_flac(f, header):
+    # fLaC is always followed by the STREAMINFO block (4-byte block header + 34 bytes)
+    f.seek(8)
+    info = f.read(34)
+    if len(info) < 18:
+        return None
+    packed = int.from_bytes(info[10:18], "big")
+    rate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    total_samples = packed & 0xFFFFFFFFF
+    return AudioInfo("FLAC", rate, channels, total_samples / rate if total_samples and rate else None)
+
+
+def _probe_ogg_opus(f, header, file_size):
+    segments = header[26]
+    f.seek(27 + segments)
+    head = f.read(19)
+    if head[:8] != b"OpusHead":
+        return None
+    channels, pre_skip, input_rate = head[9], struct.unpack("<H", head[10:12])[0], struct.unpack("<I", head[12:16])[0]
+    # Duration from the granule position (samples at 48 kHz) of the last page
+    f.seek(max(0, file_size - 65536))
+    tail = f.read()
+    last = tail.rfind(b"OggS")
+    duration = None
+    if last >= 0 and last + 14 <= len(tail):
+        granule = struct.unpack("<q", tail[last + 6:last + 14])[0]
+        duration = max(0, granule - pre_skip) / 48000
+    rate = input_rate if input_rate in OPUS_SAMPLE_RATES else 48000
+    return AudioInfo("OGG_OPUS", rate, channels, duration)
+
+
+def _probe_mp3(file_path):
+    import convert
+
+    layout = convert._mp3_layout(file_path)
+    if layout is None:
+        return None
+    rate, channels, duration = layout
+    return AudioInfo("MP3", rate, channels, duration)
+
+
+def probe_audio(file_path):
+    """
+    Read the encoding, sample rate, channel count and duration from the file header.
+
+    WAV (16-bit PCM / mu-law), FLAC, OGG Opus and MP3 are recognized by their magic bytes.
+    Returns None for anything else, which then has to be transcoded.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        header = f.read(64)
+        if header[:4] == b"RIFF":
+            return _probe_wav(file_path)
+        if header[:4] == b"fLaC":
+            return _probe_flac(f, header)
+        if header[:4] == b"OggS":
+            return _probe_ogg_opus(f, header, file_size)
+        if header[:3] == b"ID3" or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+            return _probe_mp3(file_path)
+    return None
+
+
+def transcode_audio(file_path, codec="flac", sample_rate=16000):
+    """
+    Transcode to compact mono FLAC or OGG Opus with ffmpeg and return the path of a temporary file
+    (the caller deletes it).
+    """
+    if codec == "opus":
+        suffix, options = ".ogg", ["-c:a", "libopus", "-b:a", "32k"]
+    else:
+        suffix, options = ".flac", ["-c:a", "flac"]
+    fd, output = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", file_path,
+               "-ac", "1", "-ar", str(sample_rate), *options, output]
+    if subprocess.run(command).returncode:
+        os.remove(output)
+        raise RuntimeError(f"ffmpeg failed to transcode {file_path}")
+    return output
+
+
+def prepare_audio(file_path, transcode=None, inline_max_seconds=INLINE_MAX_SECONDS):
+    """
+    Probe the file and transcode it when needed.
+
+    Files the API cannot take as they are are always transcoded (to FLAC unless transcode says
+    otherwise). With transcode ("flac" or "opus"), files too long for inline recognition are
+    transcoded as well, to cut upload bytes; the original is kept if that does not make it smaller
+    (e.g. a low-bitrate MP3 transcoded to FLAC).
+
+    Returns:
+        tuple: (path to send, AudioInfo, temporary file to delete or None)
+    """
+    info = probe_audio(file_path)
+    if info is not None and not (transcode and not fits_inline(file_path, info, inline_max_seconds)):
+        return file_path, info, None
+    print(f"Transcoding {file_path} to {transcode or 'flac'}...")
+    temp_path = transcode_audio(file_path, transcode or "flac")
+    transcoded = probe_audio(temp_path)
+    if transcoded is None:
+        os.remove(temp_path)
+        raise RuntimeError(f"Could not read the transcoded audio of {file_path}")
+    if info is not None and os.path.getsize(temp_path) >= os.path.getsize(file_path):
+        os.remove(temp_path)
+        return file_path, info, None
+    return temp_path, transcoded, temp_path
+
+
+def fits_inline(file_path, info, inline_max_seconds=INLINE_MAX_SECONDS):
+    """Whether the file is short enough for synchronous recognize with inline content."""
+    return (info.duration is not None and info.duration <= inline_max_seconds
+            and os.path.getsize(file_path) <= INLINE_MAX_BYTES)
+
+
+def recognition_config(info, language_code="ja-JP"):
+    """RecognitionConfig whose encoding and sample rate match the probed header."""
+    from google.cloud import speech
+
+    config = speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding[info.encoding],
+        sample_rate_hertz=info.sample_rate,
+        language_code=language_code,
+        enable_automatic_punctuation=True,
+    )
+    if info.channels > 1 and info.encoding in ("LINEAR16", "FLAC"):
+        config.audio_channel_count = info.channels
+    return config
+
+
+def upload_blob(blob, file_path, upload_workers=8, chunk_size=32 * 1024 * 1024):
+    """
+    Upload a file to a blob. Files larger than one chunk are uploaded as parallel parts
+    (XML multipart upload) with upload_workers threads, or as a chunked resumable upload
+    with a single worker.
+    """
+    size = os.path.getsize(file_path)
+    with metrics.api_call("gcs.upload") as call:
+        call["bytes_sent"] = size
+        if size > chunk_size and upload_workers > 1:
+            from google.cloud.storage import transfer_manager
+
+            transfer_manager.upload_chunks_concurrently(
+                file_path, blob, chunk_size=chunk_size, max_workers=upload_workers, worker_type="thread")
+        else:
+            if size > chunk_size:
+                blob.chunk_size = chunk_size
+            blob.upload_from_filename(file_path)
+
+
+def _write_transcript(output_path, text):
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def _response_text(response):
+    return "".join(result.alternatives[0].transcript + "\n" for result in response.results if result.alternatives)
+
+
+def transcribe_audio(file_path, output_path=None, credentials_path=None, bucket_name=None, transcode=None,
+                     inline_max_seconds=INLINE_MAX_SECONDS, upload_workers=8, language_code="ja-JP",
+                     speech_client=None, storage_client=None):
     """
     Transcribe an audio file using Google Cloud Speech-to-Text API.
 
+    The encoding, sample rate and channel count are taken from the file header. Files of up to
+    inline_max_seconds (and 10 MB) are sent inline to synchronous recognize without touching
+    GCS; longer ones are uploaded to GCS and transcribed with long_running_recognize.
+
     Args:
         file_path (str): Path to the audio file
         output_path (str, optional): Path to save the transcription. If not provided, only returns the text
         credentials_path (str, optional): Path to GCP service account key JSON file.
             If not provided, will look for GOOGLE_APPLICATION_CREDENTIALS env variable
         bucket_name (str, optional): Name of the GCS bucket to use. If not provided, will look for
-            GOOGLE_CLOUD_BUCKET env variable
+            GOOGLE_CLOUD_BUCKET env variable. Not needed for files sent inline
+        transcode (str, optional): "flac" or "opus" to transcode files that go through GCS before uploading
+        inline_max_seconds (float, optional): Longest audio sent inline (0 always uses GCS)
+        upload_workers (int, optional): Parallel upload parts for large files
+        language_code (str, optional): Recognition language
+        speech_client (speech.SpeechClient, optional): Client to use instead of creating one
+        storage_client (storage.Client, optional): Client to use instead of creating one
 
     Returns:
         str: Transcribed text
@@ -26,74 +236,431 @@ def transcribe_audio(file_path, output_path=None, credentials_path=None, bucket_
     # Set credentials if provided
     if credentials_path:
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
-    elif not os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+    elif speech_client is None and not os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
         raise ValueError("GCP credentials not found. Please provide credentials_path or set GOOGLE_APPLICATION_CREDENTIALS environment variable")
 
-    # Get bucket name
-    bucket_name = bucket_name or os.getenv("GOOGLE_CLOUD_BUCKET")
-    if not bucket_name:
-        raise ValueError("GCS bucket not specified. Please provide bucket_name or set GOOGLE_CLOUD_BUCKET environment variable")
+    from google.cloud import speech
+
+    upload_path, info, temp_path = prepare_audio(file_path, transcode, inline_max_seconds)
+    try:
+        config = recognition_config(info, language_code)
+        if speech_client is None:
+            speech_client = speech.SpeechClient()
 
-    # Initialize clients
-    storage_client = storage.Client()
-    speech_client = speech.SpeechClient()
+        if fits_inline(upload_path, info, inline_max_seconds):
+            print("Transcribing audio inline...")
+            with open(upload_path, "rb") as f:
+                content = f.read()
+            with metrics.api_call("speech.recognize") as call:
+                call["bytes_sent"] = len(content)
+                response = speech_client.recognize(config=config, audio=speech.RecognitionAudio(content=content))
+            transcribed_text = _response_text(response)
+        else:
+            # Get bucket name
+            bucket_name = bucket_name or os.getenv("GOOGLE_CLOUD_BUCKET")
+            if not bucket_name:
+                raise ValueError("GCS bucket not specified. Please provide bucket_name or set GOOGLE_CLOUD_BUCKET environment variable")
+            if storage_client is None:
+                from google.cloud import storage
+
+                storage_client = storage.Client()
+
+            # Upload file to GCS
+            bucket = storage_client.bucket(bucket_name)
+            blob_name = f"audio_transcription/{str(uuid.uuid4())}{os.path.splitext(upload_path)[1]}"
+            blob = bucket.blob(blob_name)
+
+            print("Uploading audio file to Google Cloud Storage...")
+            upload_blob(blob, upload_path, upload_workers)
+            gcs_uri = f"gs://{bucket_name}/{blob_name}"
+
+            try:
+                print("Transcribing audio file...")
+                audio = speech.RecognitionAudio(uri=gcs_uri)
+
+                # Start long-running recognition operation
+                with metrics.api_call("speech.long_running_recognize"):
+                    operation = speech_client.long_running_recognize(config=config, audio=audio)
+                    print("Waiting for operation to complete...")
+                    response = operation.result(timeout=6000)
+                transcribed_text = _response_text(response)
+            finally:
+                # Clean up: delete the file from GCS
+                print("Cleaning up: deleting file from Google Cloud Storage...")
+                with metrics.api_call("gcs.delete"):
+                    blob.delete()
+
+        if output_path:
+            _write_transcript(output_path, transcribed_text)
+
+        return transcribed_text.strip()
+
+    except Exception as e:
+        raise Exception(f"Error during transcription: {str(e)}")
+    finally:
+        if temp_path:
+            os.remove(temp_path)
+
+def _start_job(file_path, bucket, speech_client, transcode, inline_max_seconds, upload_workers, language_code):
+    """
+    Prepare one batch file and either transcribe it inline or upload it and start its
+    long-running operation.
+
+    Returns:
+        tuple: ("done", text, None) for inline files, ("started", operation, blob) otherwise
+    """
+    from google.cloud import speech
 
+    upload_path, info, temp_path = prepare_audio(file_path, transcode, inline_max_seconds)
     try:
-        # Upload file to GCS
-        bucket = storage_client.bucket(bucket_name)
-        blob_name = f"audio_transcription/{str(uuid.uuid4())}{os.path.splitext(file_path)[1]}"
+        config = recognition_config(info, language_code)
+        if fits_inline(upload_path, info, inline_max_seconds):
+            with open(upload_path, "rb") as f:
+                content = f.read()
+            with metrics.api_call("speech.recognize") as call:
+                call["bytes_sent"] = len(content)
+                response = speech_client.recognize(config=config, audio=speech.RecognitionAudio(content=content))
+            return "done", _response_text(response), None
+
+        if bucket is None:
+            raise ValueError("GCS bucket not specified. Please provide bucket_name or set GOOGLE_CLOUD_BUCKET environment variable")
+        blob_name = f"audio_transcription/{str(uuid.uuid4())}{os.path.splitext(upload_path)[1]}"
         blob = bucket.blob(blob_name)
+        upload_blob(blob, upload_path, upload_workers)
+        try:
+            audio = speech.RecognitionAudio(uri=f"gs://{bucket.name}/{blob_name}")
+            with metrics.api_call("speech.long_running_recognize"):
+                operation = speech_client.long_running_recognize(config=config, audio=audio)
+        except Exception:
+            _delete_blobs(bucket, [blob])
+            raise
+        return "started", operation, blob
+    finally:
+        if temp_path:
+            os.remove(temp_path)
 
-        print("Uploading audio file to Google Cloud Storage...")
-        blob.upload_from_filename(file_path)
-        gcs_uri = f"gs://{bucket_name}/{blob_name}"
 
+def _delete_blobs(bucket, blobs, batch_size=100):
+    """Delete blobs with batched requests (up to batch_size deletes per HTTP request)."""
+    for i in range(0, len(blobs), batch_size):
+        batch = blobs[i:i + batch_size]
         try:
-            print("Transcribing audio file...")
-            audio = speech.RecognitionAudio(uri=gcs_uri)
-            config = speech.RecognitionConfig(
-                encoding=speech.RecognitionConfig.AudioEncoding.MP3,
-                sample_rate_hertz=44100,  # Adjust based on your audio file
-                language_code="ja-JP",
-                enable_automatic_punctuation=True,
-            )
-
-            # Start long-running recognition operation
-            operation = speech_client.long_running_recognize(config=config, audio=audio)
-            print("Waiting for operation to complete...")
-            response = operation.result(timeout=6000)
-
-            transcribed_text = ""
-            for result in response.results:
-                transcribed_text += result.alternatives[0].transcript + "\n"
-
-            if output_path:
-                output_dir = os.path.dirname(output_path)
-                if output_dir:
-                    os.makedirs(output_dir, exist_ok=True)
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(transcribed_text)
-
-            return transcribed_text.strip()
-
-        finally:
-            # Clean up: delete the file from GCS
-            print("Cleaning up: deleting file from Google Cloud Storage...")
-            blob.delete()
+            with metrics.api_call("gcs.delete_blobs", blobs=len(batch)):
+                with bucket.client.batch():
+                    bucket.delete_blobs(batch, on_error=lambda blob: None)
+        except Exception as e:
+            print(f"Warning: could not delete {len(batch)} blob(s) from Google Cloud Storage: {e}")
+
+
+def batch_output_path(file_path, output_dir):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(file_path))[0] + ".txt")
+
+
+def transcribe_batch(file_paths, output_dir, credentials_path=None, bucket_name=None, transcode=None,
+                     inline_max_seconds=INLINE_MAX_SECONDS, upload_workers=8, concurrency=8,
+                     poll_interval=2, max_poll_interval=60, timeout=6000, language_code="ja-JP",
+                     speech_client=None, storage_client=None):
+    """
+    Transcribe many audio files at once.
+
+    Files are prepared and uploaded concurrently, and each long-running operation is started as
+    soon as its upload finishes. All operations are then polled together, backing off from
+    poll_interval to max_poll_interval while nothing completes, and each transcript is written
+    to output_dir as soon as its operation is done. Uploaded blobs are deleted in batches at
+    the end, so the whole batch takes about as long as its slowest job.
+
+    Args:
+        file_paths (list): Paths to the audio files
+        output_dir (str): Directory to write <file name>.txt transcripts to
+        credentials_path (str, optional): Path to GCP service account key JSON file.
+            If not provided, will look for GOOGLE_APPLICATION_CREDENTIALS env variable
+        bucket_name (str, optional): Name of the GCS bucket to use. If not provided, will look for
+            GOOGLE_CLOUD_BUCKET env variable. Not needed if every file is sent inline
+        transcode (str, optional): "flac" or "opus" to transcode files that go through GCS before uploading
+        inline_max_seconds (float, optional): Longest audio sent inline (0 always uses GCS)
+        upload_workers (int, optional): Parallel upload parts per large file
+        concurrency (int, optional): Files prepared and uploaded at the same time
+        poll_interval (float, optional): First delay between polls of the running operations
+        max_poll_interval (float, optional): Longest delay between polls
+        timeout (float, optional): Seconds from the start of the batch after which operations
+            still running are given up
+        language_code (str, optional): Recognition language
+        speech_client (speech.SpeechClient, optional): Client to use instead of creating one
+        storage_client (storage.Client, optional): Client to use instead of creating one
+
+    Returns:
+        dict: File path -> output path for the transcribed files, or the exception for failed ones
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    outputs = {file_path: batch_output_path(file_path, output_dir) for file_path in file_paths}
+    if len(set(outputs.values())) < len(outputs):
+        raise ValueError("Batch input files must have distinct file names")
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Audio file not found: {file_path}")
+
+    if credentials_path:
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
+    elif speech_client is None and not os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+        raise ValueError("GCP credentials not found. Please provide credentials_path or set GOOGLE_APPLICATION_CREDENTIALS environment variable")
+
+    if speech_client is None:
+        from google.cloud import speech
+
+        speech_client = speech.SpeechClient()
+    bucket = None
+    bucket_name = bucket_name or os.getenv("GOOGLE_CLOUD_BUCKET")
+    if bucket_name:
+        if storage_client is None:
+            from google.cloud import storage
+
+            storage_client = storage.Client()
+        bucket = storage_client.bucket(bucket_name)
+
+    results = {}
+    running = {}  # file path -> long-running operation
+    blobs = []
+
+    def finish(file_path, text):
+        _write_transcript(outputs[file_path], text)
+        results[file_path] = outputs[file_path]
+        print(f"Transcribed {file_path} -> {outputs[file_path]}")
+
+    def fail(file_path, error):
+        results[file_path] = error
+        print(f"Error: {file_path}: {error}")
+
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            print(f"Uploading {len(file_paths)} files...")
+            starting = {
+                file_path: executor.submit(_start_job, file_path, bucket, speech_client, transcode,
+                                           inline_max_seconds, upload_workers, language_code)
+                for file_path in file_paths
+            }
+            interval = poll_interval
+            while starting or running:
+                progressed = False
+                for file_path, future in list(starting.items()):
+                    if not future.done():
+                        continue
+                    del starting[file_path]
+                    progressed = True
+                    try:
+                        state, value, blob = future.result()
+                    except Exception as e:
+                        fail(file_path, e)
+                        continue
+                    if state == "done":
+                        finish(file_path, value)
+                    else:
+                        running[file_path] = value
+                        blobs.append(blob)
 
+                for file_path, operation in list(running.items()):
+                    try:
+                        with metrics.api_call("speech.operation.poll"):
+                            done = operation.done()
+                        if not done:
+                            continue
+                        del running[file_path]
+                        progressed = True
+                        finish(file_path, _response_text(operation.result()))
+                    except Exception as e:
+                        running.pop(file_path, None)
+                        progressed = True
+                        fail(file_path, e)
+
+                if not (starting or running):
+                    break
+                if running and time.monotonic() - start > timeout:
+                    for file_path in list(running):
+                        fail(file_path, TimeoutError(f"Operation did not finish within {timeout} seconds"))
+                    running.clear()
+                    continue
+                # Poll again soon after progress, and back off while every job is still running.
+                # Finished uploads wake the loop up early
+                interval = poll_interval if progressed else min(interval * 2, max_poll_interval)
+                if starting:
+                    wait(starting.values(), timeout=interval if running else None, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(interval)
+    finally:
+        if blobs:
+            print(f"Cleaning up: deleting {len(blobs)} files from Google Cloud Storage...")
+            _delete_blobs(bucket, blobs)
+    return results
+
+def _paced(chunks, chunk_seconds, max_speed):
+    """Yield chunks no faster than max_speed times real time (0 disables pacing)."""
+    start = time.monotonic()
+    for i, chunk in enumerate(chunks):
+        if max_speed > 0:
+            delay = start + i * chunk_seconds / max_speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        yield chunk
+
+def create_speech_client(endpoint=None):
+    """
+    Create a Speech client. If endpoint is given (host:port), connect over an insecure
+    channel instead, e.g. to a local fake servicer.
+    """
+    from google.cloud import speech
+
+    if endpoint:
+        import grpc
+        from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+
+        channel = grpc.insecure_channel(endpoint)
+        return speech.SpeechClient(transport=SpeechGrpcTransport(channel=channel))
+    return speech.SpeechClient()
+
+def transcribe_audio_streaming(file_path, output_path=None, credentials_path=None, endpoint=None,
+                               speech_client=None, language_code="ja-JP", sample_rate=16000,
+                               chunk_ms=100, stream_limit_seconds=290, max_speed=1.0):
+    """
+    Transcribe an audio file with StreamingRecognize, without uploading it to GCS.
+
+    The file is decoded locally and fed to the API in chunk_ms chunks. Because a single
+    stream is limited to about five minutes of audio, the stream is reopened every
+    stream_limit_seconds. Final results are appended to output_path as they arrive.
+
+    Args:
+        file_path (str): Path to the audio file
+        output_path (str, optional): Path to save the transcription. If not provided, only returns the text
+        credentials_path (str, optional): Path to GCP service account key JSON file.
+            If not provided, will look for GOOGLE_APPLICATION_CREDENTIALS env variable
+        endpoint (str, optional): host:port of a Speech endpoint to use over an insecure channel
+        speech_client (speech.SpeechClient, optional): Client to use instead of creating one
+        language_code (str, optional): Recognition language
+        sample_rate (int, optional): Sample rate the audio is decoded to
+        chunk_ms (int, optional): Duration of audio sent per request
+        stream_limit_seconds (int, optional): Audio duration after which the stream is reopened
+        max_speed (float, optional): Send audio at most this many times real time. The API rejects audio
+            sent much faster than real time, so 0 (no pacing) is only meant for local fakes
+
+    Returns:
+        str: Transcribed text
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Audio file not found: {file_path}")
+
+    if speech_client is None:
+        if credentials_path:
+            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = credentials_path
+        elif not endpoint and not os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+            raise ValueError("GCP credentials not found. Please provide credentials_path or set GOOGLE_APPLICATION_CREDENTIALS environment variable")
+        speech_client = create_speech_client(endpoint)
+
+    from google.cloud import speech
+    import convert
+
+    streaming_config = speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=sample_rate,
+            language_code=language_code,
+            enable_automatic_punctuation=True,
+        ),
+        interim_results=False,
+    )
+    chunk_seconds = chunk_ms / 1000
+    chunks_per_stream = max(1, int(stream_limit_seconds / chunk_seconds))
+    chunks = convert.stream_pcm16(file_path, sample_rate, int(sample_rate * chunk_seconds))
+
+    output = None
+    if output_path:
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        output = open(output_path, 'w', encoding='utf-8')
+
+    transcripts = []
+    try:
+        stream_index = 0
+        while True:
+            first = next(chunks, None)
+            if first is None:
+                break
+            stream_index += 1
+            print(f"Streaming audio (stream {stream_index})...")
+            stream_chunks = itertools.chain([first], itertools.islice(chunks, chunks_per_stream - 1))
+            with metrics.api_call("speech.streaming_recognize") as call:
+                def requests():
+                    for chunk in _paced(stream_chunks, chunk_seconds, max_speed):
+                        call["bytes_sent"] += len(chunk)
+                        yield speech.StreamingRecognizeRequest(audio_content=chunk)
+
+                responses = speech_client.streaming_recognize(config=streaming_config, requests=requests())
+                for response in responses:
+                    for result in response.results:
+                        if not result.is_final or not result.alternatives:
+                            continue
+                        text = result.alternatives[0].transcript
+                        transcripts.append(text)
+                        if output:
+                            output.write(text + "\n")
+                            output.flush()
+        return "\n".join(transcripts).strip()
     except Exception as e:
         raise Exception(f"Error during transcription: {str(e)}")
+    finally:
+        chunks.close()
+        if output:
+            output.close()
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Transcribe audio file using Google Cloud Speech-to-Text')
-    parser.add_argument('file_path', help='Path to the audio file')
+    parser.add_argument('file_path', nargs='+', help='Path to the audio file (several files run as a batch)')
     parser.add_argument('-o', '--output', help='Path to save the transcription (optional)')
+    parser.add_argument('--output-dir', help='Batch: directory to write <file name>.txt transcripts to (required with several files)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Batch: files prepared and uploaded at the same time (default: 8)')
+    parser.add_argument('--poll-interval', type=float, default=2, help='Batch: first delay in seconds between polls of running operations, doubled up to 60 while none finishes (default: 2)')
     parser.add_argument('--credentials', help='Path to GCP service account key JSON file (optional if GOOGLE_APPLICATION_CREDENTIALS env variable is set)')
     parser.add_argument('--bucket', help='GCS bucket name (optional if GOOGLE_CLOUD_BUCKET env variable is set)')
-    args = parser.parse_args()
+    parser.add_argument('--streaming', action='store_true', help='Use StreamingRecognize on locally decoded audio instead of uploading to GCS')
+    parser.add_argument('--endpoint', help='Speech API host:port to connect to over an insecure channel (e.g. a local fake)')
+    parser.add_argument('--max-speed', type=float, default=1.0, help='Streaming: send audio at most this many times real time (default: 1.0; 0 disables pacing, for local fakes only)')
+    parser.add_argument('--transcode', choices=['flac', 'opus'], help='Transcode files that go through GCS to compact mono FLAC or OGG Opus before uploading')
+    parser.add_argument('--inline-max-seconds', type=float, default=INLINE_MAX_SECONDS, help=f'Send files up to this long inline to synchronous recognize, without GCS (default: {INLINE_MAX_SECONDS}; 0 disables)')
+    parser.add_argument('--upload-workers', type=int, default=8, help='Parallel upload parts for large files (default: 8)')
+    parser.add_argument('--metrics', help='Write per-API-call metrics to this file (.prom for a Prometheus textfile, JSON lines otherwise)')
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable(args.metrics)
+
+    batch = len(args.file_path) > 1 or args.output_dir
+    if batch:
+        if args.streaming or args.output:
+            parser.error('--streaming and --output take a single file; use --output-dir for a batch')
+        if not args.output_dir:
+            parser.error('--output-dir is required with several files')
+        try:
+            results = transcribe_batch(args.file_path, args.output_dir, args.credentials, args.bucket,
+                                       transcode=args.transcode, inline_max_seconds=args.inline_max_seconds,
+                                       upload_workers=args.upload_workers, concurrency=args.concurrency,
+                                       poll_interval=args.poll_interval)
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            exit(1)
+        failed = [path for path, result in results.items() if isinstance(result, Exception)]
+        print(f"Transcribed {len(results) - len(failed)} of {len(results)} files to {args.output_dir}")
+        if failed:
+            exit(1)
+        return
+    args.file_path = args.file_path[0]
 
     try:
-        transcription = transcribe_audio(args.file_path, args.output, args.credentials, args.bucket)
+        if args.streaming:
+            transcription = transcribe_audio_streaming(args.file_path, args.output, args.credentials,
+                                                       endpoint=args.endpoint, max_speed=args.max_speed)
+        else:
+            transcription = transcribe_audio(args.file_path, args.output, args.credentials, args.bucket,
+                                             transcode=args.transcode, inline_max_seconds=args.inline_max_seconds,
+                                             upload_workers=args.upload_workers)
         print("Transcription completed successfully")
         if args.output:
             print(f"Transcription saved to: {args.output}")
@@ -1,24 +1,37 @@
 import argparse
 import csv
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import inflection
-from openai import OpenAI
-
-API_KEY = os.environ["OPENAI_API_KEY"]
-client = OpenAI(
-    api_key=API_KEY,
-    organization='org-yQqX8paIy5c7VRHlOdno8RQ3'
-)
-
-parser = argparse.ArgumentParser(description='Generate columns from mermaid')
-parser.add_argument('--input_file', '-i', type=str, help='input file path')
-parser.add_argument('--output_file', '-o', type=str, help='output file path')
-parser.add_argument('--source_col_index', '-s', type=int, help='source column index')
-parser.add_argument('--target_col_index', '-t', type=int, help='target column index')
-args = parser.parse_args()
-
-def translate_japanese_to_english_snake_case(input_csv_path, source_col_index, target_col_index, output_csv_path):
+
+from glossary import DEFAULT_GLOSSARY_PATH, Glossary
+
+_client = None
+
+
+def get_client():
+    """ Create the OpenAI client on first use so importing this module stays cheap """
+    global _client
+    if _client is None:
+        from openai import OpenAI
+
+        _client = OpenAI(
+            api_key=os.environ["OPENAI_API_KEY"],
+            organization='org-yQqX8paIy5c7VRHlOdno8RQ3'
+        )
+    return _client
+
+def translate_term(japanese_text):
+    messages = [{"role": "system", "content": f"Translate this Japanese text to English in snake case: '{japanese_text}'"}]
+    completion = get_client().chat.completions.create(
+         model="gpt-4",
+         messages=messages,
+    )
+    return completion.choices[0].message.content
+
+def translate_japanese_to_english_snake_case(input_csv_path, source_col_index, target_col_index, output_csv_path, glossary=None):
     with open(input_csv_path, mode='r', encoding='utf-8') as infile, open(output_csv_path, mode='w', encoding='utf-8', newline='') as outfile:
         reader = csv.reader(infile)
         writer = csv.writer(outfile)
@@ -35,14 +48,13 @@ def translate_japanese_to_english_snake_case(input_csv_path, source_col_index, t
                 continue
             if japanese_text in translated_dict:
                 translation = translated_dict[japanese_text]
+            elif glossary is not None and (translation := glossary.lookup(japanese_text)) is not None:
+                translated_dict[japanese_text] = translation
             else:
-                messages = [{"role": "system", "content": f"Translate this Japanese text to English in snake case: '{japanese_text}'"}]
-                completion = client.chat.completions.create(
-                     model="gpt-4",
-                     messages=messages,
-                )
-                translation = completion.choices[0].message.content
+                translation = translate_term(japanese_text)
                 translated_dict[japanese_text] = translation
+                if glossary is not None:
+                    glossary.add(japanese_text, translation)
                 print(f"Translated '{japanese_text}' to '{translation}'")
             translation_snake_case = inflection.underscore(translation)
 
@@ -52,6 +64,104 @@ def translate_japanese_to_english_snake_case(input_csv_path, source_col_index, t
             writer.writerow(row)
 
 
+def translate_batch(terms, model='gpt-4o'):
+    """ Translate a batch of Japanese terms to English snake case in one request with JSON output """
+    messages = [
+        {"role": "system", "content": "Translate each Japanese term in the given JSON array to English in snake case. "
+                                      "Respond with a JSON object that maps every input term to its translation."},
+        {"role": "user", "content": json.dumps(terms, ensure_ascii=False)},
+    ]
+    completion = get_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        response_format={"type": "json_object"},
+    )
+    translations = json.loads(completion.choices[0].message.content)
+    if not isinstance(translations, dict):
+        raise ValueError(f"Expected a JSON object, got {type(translations).__name__}")
+    return {term: translations[term] for term in terms if isinstance(translations.get(term), str)}
+
+def _translate_batch_or_empty(terms, model):
+    """ translate_batch that reports a failed request or malformed JSON and returns {} so the terms are retried one by one """
+    try:
+        return translate_batch(terms, model)
+    except Exception as e:
+        print(f"Batch of {len(terms)} terms failed ({type(e).__name__}: {e}); retrying them one by one")
+        return {}
+
+def translate_japanese_to_english_snake_case_batched(input_csv_path, source_col_index, target_col_index, output_csv_path,
+                                                     batch_size=50, concurrency=4, model='gpt-4o', glossary=None):
+    with open(input_csv_path, mode='r', encoding='utf-8') as infile:
+        reader = csv.reader(infile)
+        header = next(reader)
+        rows = list(reader)
+
+    # 1st pass: collect unique untranslated terms in first-seen order
+    terms = list(dict.fromkeys(
+        row[source_col_index] for row in rows
+        if len(row) <= target_col_index or row[target_col_index] == ''
+    ))
+    translated_dict = {}
+    if glossary is not None:
+        for japanese_text in terms:
+            translation = glossary.lookup(japanese_text)
+            if translation is not None:
+                translated_dict[japanese_text] = translation
+        terms = [japanese_text for japanese_text in terms if japanese_text not in translated_dict]
+    batches = [terms[i:i + batch_size] for i in range(0, len(terms), batch_size)]
+    print(f"Translating {len(terms)} unique terms in {len(batches)} batches")
+
+    # 2nd pass: translate batches concurrently
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for batch, translations in zip(batches, executor.map(lambda batch: _translate_batch_or_empty(batch, model), batches)):
+            translated_dict.update(translations)
+            # Terms the model left out of the JSON, or of a failed batch, are retried one by one
+            for japanese_text in batch:
+                if japanese_text not in translated_dict:
+                    translated_dict[japanese_text] = translate_term(japanese_text)
+                if glossary is not None:
+                    glossary.add(japanese_text, translated_dict[japanese_text])
+            print(f"Translated {len(translated_dict)} terms")
+
+    with open(output_csv_path, mode='w', encoding='utf-8', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(header)
+        for row in rows:
+            if len(row) > target_col_index and row[target_col_index] != '':
+                writer.writerow(row)
+                continue
+            if len(row) <= target_col_index:
+                row += [''] * (target_col_index + 1 - len(row))
+            row[target_col_index] = inflection.underscore(translated_dict[row[source_col_index]])
+            writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate columns from mermaid')
+    parser.add_argument('--input_file', '-i', type=str, help='input file path')
+    parser.add_argument('--output_file', '-o', type=str, help='output file path')
+    parser.add_argument('--source_col_index', '-s', type=int, help='source column index')
+    parser.add_argument('--target_col_index', '-t', type=int, help='target column index')
+    parser.add_argument('--batch_size', '-b', type=int, default=0, help='translate unique terms in batches of this size (0: one request per term)')
+    parser.add_argument('--concurrency', '-c', type=int, default=4, help='number of concurrent batch requests')
+    parser.add_argument('--model', type=str, default='gpt-4o', help='model used for batched translation (JSON output)')
+    parser.add_argument('--glossary', '-g', type=str, default=DEFAULT_GLOSSARY_PATH, help='persistent glossary file path')
+    parser.add_argument('--no_glossary', action='store_true', help='do not use the persistent glossary')
+    args = parser.parse_args(argv)
+
+    # スクリプトを実行
+    glossary = None if args.no_glossary else Glossary(args.glossary)
+    if args.batch_size > 0:
+        translate_japanese_to_english_snake_case_batched(args.input_file, args.source_col_index, args.target_col_index, args.output_file,
+                                                         batch_size=args.batch_size, concurrency=args.concurrency, model=args.model,
+                                                         glossary=glossary)
+    else:
+        translate_japanese_to_english_snake_case(args.input_file, args.source_col_index, args.target_col_index, args.output_file,
+                                                 glossary=glossary)
+    if glossary is not None:
+        print(glossary.report())
+        glossary.close()
+
 
-# スクリプトを実行
-translate_japanese_to_english_snake_case(args.input_file, args.source_col_index, args.target_col_index, args.output_file)
+if __name__ == '__main__':
+    main()